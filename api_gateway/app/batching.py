@@ -0,0 +1,95 @@
+"""
+Request coalescing for single-invoice lookups.
+
+Invoice lists in the front end fetch one invoice per row. Instead of sending
+each of those upstream, the gateway parks concurrent GETs that carry the same
+token for a couple of milliseconds and resolves them with one call to the
+payables multi-get endpoint. Batches are per token because the ownership
+check depends on the caller.
+"""
+import asyncio
+import os
+
+import httpx
+
+from app import clients
+
+BATCH_WINDOW = float(os.getenv("INVOICE_BATCH_WINDOW_MS", "2")) / 1000
+MAX_BATCH_SIZE = int(os.getenv("INVOICE_BATCH_MAX_SIZE", "100"))
+
+NOT_FOUND = {"detail": "Invoice not found"}
+FORBIDDEN = {"detail": "Access denied to this invoice"}
+
+
+class _Batch:
+    def __init__(self):
+        self.waiters = {}
+        self.timer = None
+
+
+class InvoiceBatcher:
+    def __init__(self, window: float = BATCH_WINDOW, max_size: int = MAX_BATCH_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self._open = {}
+        self._flushing = set()
+
+    async def get(self, token: str, invoice_id: str):
+        """
+        Resolve one invoice as (status_code, body, etag), sharing the upstream call
+        with concurrent lookups. etag is None unless the invoice was found.
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(token)
+        if batch is None:
+            batch = self._open[token] = _Batch()
+            batch.timer = loop.call_later(self.window, self._start_flush, token, batch)
+        waiter = loop.create_future()
+        batch.waiters.setdefault(invoice_id, []).append(waiter)
+        if len(batch.waiters) >= self.max_size:
+            batch.timer.cancel()
+            self._start_flush(token, batch)
+        return await waiter
+
+    def _start_flush(self, token: str, batch: _Batch):
+        if self._open.get(token) is batch:
+            del self._open[token]
+        task = asyncio.ensure_future(self._flush(token, batch))
+        # Hold a reference until the task is done so it isn't garbage collected
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, token: str, batch: _Batch):
+        try:
+            response = await clients.get("payables").post(
+                "/invoices/batch-get",
+                json={"invoice_ids": list(batch.waiters)},
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            body = response.json()
+        except (httpx.RequestError, ValueError) as e:
+            self._fail(batch, e)
+            return
+
+        if response.status_code != 200:
+            results = {invoice_id: (response.status_code, body, None) for invoice_id in batch.waiters}
+        else:
+            etags = body.get("etags", {})
+            results = {
+                invoice["invoice_id"]: (200, invoice, etags.get(invoice["invoice_id"]))
+                for invoice in body["invoices"]
+            }
+            results.update({invoice_id: (404, NOT_FOUND, None) for invoice_id in body["missing"]})
+            results.update({invoice_id: (403, FORBIDDEN, None) for invoice_id in body["forbidden"]})
+
+        for invoice_id, waiters in batch.waiters.items():
+            result = results.get(invoice_id, (404, NOT_FOUND, None))
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+    def _fail(self, batch: _Batch, error: Exception):
+        for waiters in batch.waiters.values():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(error)
@@ -0,0 +1,76 @@
+"""
+Long-lived HTTP clients for the upstream services.
+
+One httpx.AsyncClient per upstream keeps its connections alive between
+requests, so proxied calls reuse an open socket instead of paying for a new
+TCP connection and pool on every request. The clients are created in the
+app's startup hook and closed on shutdown.
+"""
+import os
+
+import httpx
+
+# Provide default values for local development
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
+PAYABLES_SERVICE_URL = os.getenv("PAYABLES_SERVICE_URL", "http://localhost:8002")
+LEDGER_SERVICE_URL = os.getenv("LEDGER_SERVICE_URL", "http://localhost:8003")
+PROJECTS_SERVICE_URL = os.getenv("PROJECTS_SERVICE_URL", "http://projects_service:8000")
+
+UPSTREAM_URLS = {
+    "auth": AUTH_SERVICE_URL,
+    "payables": PAYABLES_SERVICE_URL,
+    "ledger": LEDGER_SERVICE_URL,
+    "projects": PROJECTS_SERVICE_URL,
+}
+
+# Pool limits per upstream and worker
+MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+# How long a request may wait for a free connection before failing
+POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+# Needs the h2 package (httpx[http2]); otherwise the clients stay on HTTP/1.1
+HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+_clients = {}
+
+
+def read_timeout(name: str) -> float:
+    """Per-upstream read timeout, e.g. PAYABLES_TIMEOUT=30."""
+    return float(os.getenv(f"{name.upper()}_TIMEOUT", "10"))
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def start_clients():
+    http2 = HTTP2 and http2_available()
+    if HTTP2 and not http2:
+        print("UPSTREAM_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    for name, base_url in UPSTREAM_URLS.items():
+        if name in _clients:
+            continue
+        timeout = httpx.Timeout(read_timeout(name), connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT)
+        _clients[name] = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout, http2=http2)
+
+
+async def close_clients():
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def get(name: str) -> httpx.AsyncClient:
+    """The shared client for an upstream; only valid between startup and shutdown."""
+    return _clients[name]
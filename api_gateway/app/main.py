@@ -1,10 +1,19 @@
 from fastapi import FastAPI
+from app import clients
 from app.routes import router
 
 app = FastAPI(title="API Gateway")
 
 app.include_router(router)
 
+@app.on_event("startup")
+def open_upstream_clients():
+    clients.start_clients()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await clients.close_clients()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
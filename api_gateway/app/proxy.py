@@ -0,0 +1,129 @@
+"""
+Table-driven streaming reverse proxy.
+
+Each ProxyRoute maps a gateway path onto a path on one of the upstream
+clients. Request and response bodies are relayed as raw byte streams, so the
+gateway never parses or re-encodes them: the upstream's status code, headers
+and content encoding reach the client unchanged, and memory per request stays
+constant however large the body is.
+"""
+from typing import NamedTuple, Sequence
+from urllib.parse import quote
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.responses import StreamingResponse
+
+from app import clients
+from app.utils import validate_token
+
+# Connection-level headers that apply to a single hop and must not be forwarded (RFC 9110 7.6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+class ProxyRoute(NamedTuple):
+    methods: Sequence[str]
+    path: str
+    upstream: str
+    # Path on the upstream; may use the gateway path's {parameters}
+    upstream_path: str
+    # Check the caller's bearer token at the gateway before forwarding
+    authenticated: bool = False
+    # Timeout override in seconds (None waits as long as the upstream takes);
+    # by default the upstream client's own timeouts apply
+    timeout: object = httpx.USE_CLIENT_DEFAULT
+
+
+def hop_by_hop(headers) -> set:
+    """Hop-by-hop header names, including any the Connection header lists."""
+    listed = headers.get("connection", "")
+    return HOP_BY_HOP_HEADERS | {name.strip().lower() for name in listed.split(",") if name.strip()}
+
+
+def request_headers(request: Request) -> list:
+    excluded = hop_by_hop(request.headers) | {"host"}
+    headers = [(name, value) for name, value in request.headers.items() if name.lower() not in excluded]
+    client_host = request.client.host if request.client else None
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if client_host:
+        forwarded_for = f"{forwarded_for}, {client_host}" if forwarded_for else client_host
+    if forwarded_for:
+        headers = [(name, value) for name, value in headers if name.lower() != "x-forwarded-for"]
+        headers.append(("x-forwarded-for", forwarded_for))
+    headers.append(("x-forwarded-proto", request.url.scheme))
+    if "host" in request.headers:
+        headers.append(("x-forwarded-host", request.headers["host"]))
+    return headers
+
+
+def response_headers(response: httpx.Response) -> list:
+    excluded = hop_by_hop(response.headers)
+    return [
+        (name, value) for name, value in response.headers.raw
+        if name.decode("latin-1").lower() not in excluded
+    ]
+
+
+def upstream_url(route: ProxyRoute, request: Request) -> str:
+    params = {name: quote(str(value), safe="") for name, value in request.path_params.items()}
+    url = route.upstream_path.format(**params)
+    if request.url.query:
+        url += "?" + request.url.query
+    return url
+
+
+async def relay_body(response: httpx.Response):
+    """The upstream body exactly as received; the connection goes back to the pool when done."""
+    try:
+        async for chunk in response.aiter_raw():
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+async def forward(route: ProxyRoute, request: Request) -> StreamingResponse:
+    client = clients.get(route.upstream)
+    # Only stream a body when the client sent one, so bodiless requests stay bodiless upstream
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    upstream_request = client.build_request(
+        request.method,
+        upstream_url(route, request),
+        headers=request_headers(request),
+        content=request.stream() if has_body else None,
+        timeout=route.timeout,
+    )
+    try:
+        upstream_response = await client.send(upstream_request, stream=True)
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=502, detail=f"{route.upstream.capitalize()} service unreachable: {e}")
+
+    response = StreamingResponse(relay_body(upstream_response), status_code=upstream_response.status_code)
+    response.raw_headers = response_headers(upstream_response)
+    return response
+
+
+def proxy_endpoint(route: ProxyRoute):
+    async def endpoint(request: Request):
+        return await forward(route, request)
+    return endpoint
+
+
+def add_proxy_routes(router: APIRouter, routes: Sequence[ProxyRoute]):
+    for route in routes:
+        router.add_api_route(
+            route.path,
+            proxy_endpoint(route),
+            methods=list(route.methods),
+            dependencies=[Depends(validate_token)] if route.authenticated else None,
+            name=f"proxy {route.upstream}{route.upstream_path}",
+        )
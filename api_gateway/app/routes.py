@@ -1,81 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from app.utils import validate_token
+from app.batching import InvoiceBatcher
+from app.clients import PAYABLES_SERVICE_URL
+from app.proxy import ProxyRoute, add_proxy_routes
 import httpx
-import os
 
 router = APIRouter()
 
-# Provide default values for local development
-AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
-PAYABLES_SERVICE_URL = os.getenv("PAYABLES_SERVICE_URL", "http://localhost:8002")
+invoice_batcher = InvoiceBatcher()
 
-@router.post("/auth/register")
-async def register(user_data: dict):
-    if not AUTH_SERVICE_URL:
-        raise HTTPException(status_code=500, detail="AUTH_SERVICE_URL not set")
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(f"{AUTH_SERVICE_URL}/auth/register", json=user_data)
-            return response.json()
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"Auth service unreachable: {e}")
-
-@router.post("/auth/login")
-async def login(credentials: dict):
-    if not AUTH_SERVICE_URL:
-        raise HTTPException(status_code=500, detail="AUTH_SERVICE_URL not set")
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(f"{AUTH_SERVICE_URL}/auth/login", json=credentials)
-            return response.json()
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"Auth service unreachable: {e}")
-
-@router.get("/payables/invoices")
-async def get_invoices(token: str = Depends(validate_token)):
-    if not PAYABLES_SERVICE_URL:
-        raise HTTPException(status_code=500, detail="PAYABLES_SERVICE_URL not set")
-    async with httpx.AsyncClient() as client:
-        headers = {"Authorization": f"Bearer {token}"}
-        try:
-            response = await client.get(f"{PAYABLES_SERVICE_URL}/invoices", headers=headers)
-            return response.json()
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"Payables service unreachable: {e}")
-
-@router.post("/payables/invoices")
-async def create_invoice(invoice_data: dict, token: str = Depends(validate_token)):
-    if not PAYABLES_SERVICE_URL:
-        raise HTTPException(status_code=500, detail="PAYABLES_SERVICE_URL not set")
-    async with httpx.AsyncClient() as client:
-        headers = {"Authorization": f"Bearer {token}"}
-        try:
-            response = await client.post(f"{PAYABLES_SERVICE_URL}/invoices", json=invoice_data, headers=headers)
-            response.raise_for_status() # Raise an exception for bad status codes
-            return response.json()
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"Payables service unreachable: {e}")
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+def etag_matches(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
 
 @router.get("/payables/invoices/{invoice_id}")
-async def get_invoice(invoice_id: str, token: str = Depends(validate_token)):
+async def get_invoice(invoice_id: str, request: Request, token: str = Depends(validate_token)):
     if not PAYABLES_SERVICE_URL:
         raise HTTPException(status_code=500, detail="PAYABLES_SERVICE_URL not set")
-    async with httpx.AsyncClient() as client:
-        headers = {"Authorization": f"Bearer {token}"}
-        try:
-            response = await client.get(f"{PAYABLES_SERVICE_URL}/invoices/{invoice_id}", headers=headers)
-            response.raise_for_status() # Raise an exception for bad status codes
-            return response.json()
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"Payables service unreachable: {e}")
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
-
-@router.get("/projects/{project_id}/transactions")
-async def get_project_transactions(project_id: str):
-    PROJECTS_SERVICE_URL = os.getenv("PROJECTS_SERVICE_URL", "http://projects_service:8000")
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{PROJECTS_SERVICE_URL}/projects/{project_id}/transactions")
-        return response.json()
+    # Concurrent lookups with the same token share one multi-get upstream
+    try:
+        status_code, body, etag = await invoice_batcher.get(token, invoice_id)
+    except (httpx.RequestError, ValueError) as e:
+        raise HTTPException(status_code=502, detail=f"Payables service unreachable: {e}")
+    if status_code != 200:
+        return JSONResponse(content=body, status_code=status_code)
+    if etag is None:
+        return body
+    # The multi-get doesn't see the client's If-None-Match, so compare against the invoice's ETag here
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=body, headers={"ETag": etag})
+
+# Routes relayed to an upstream as-is: bodies are streamed through untouched and
+# the upstream's status and headers are returned to the client.
+PROXY_ROUTES = [
+    ProxyRoute(["POST"], "/auth/register", "auth", "/auth/register"),
+    ProxyRoute(["POST"], "/auth/login", "auth", "/auth/login"),
+    ProxyRoute(["POST"], "/auth/refresh", "auth", "/auth/refresh"),
+    ProxyRoute(["POST"], "/auth/logout", "auth", "/auth/logout"),
+    # Hashing a large batch takes a while, so don't cut it off at AUTH_TIMEOUT
+    ProxyRoute(["POST"], "/auth/users/bulk", "auth", "/users/bulk", authenticated=True, timeout=None),
+    ProxyRoute(["GET", "POST"], "/payables/invoices", "payables", "/invoices", authenticated=True),
+    ProxyRoute(["POST"], "/payables/invoices/batch-get", "payables", "/invoices/batch-get", authenticated=True),
+    ProxyRoute(["GET"], "/projects/{project_id}/transactions", "projects", "/projects/{project_id}/transactions"),
+]
+
+add_proxy_routes(router, PROXY_ROUTES)
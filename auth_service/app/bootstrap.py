@@ -0,0 +1,96 @@
+# auth_service/bootstrap.py
+
+"""
+One-shot schema and seed setup for the auth service: creates the tables, the
+default roles and the superadmin account.
+
+Run it once per deploy, before starting the workers:
+
+    python -m app.bootstrap
+
+Serving workers then start without touching the database. Re-running it is
+harmless, and concurrent runs are serialized with a Postgres advisory lock.
+"""
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import crud, models
+from app.database import SessionLocal, engine
+
+DEFAULT_ROLES = ["Volunteer", "Admin", "Superadmin"]
+SUPERADMIN_USERNAME = os.getenv("SUPERADMIN_USERNAME", "superadmin@gmail.com")
+SUPERADMIN_PASSWORD = os.getenv("SUPERADMIN_PASSWORD", "12345")
+
+# Arbitrary key shared by every bootstrap run
+BOOTSTRAP_LOCK_KEY = 7_340_022
+# The database container may still be starting when this runs
+CONNECT_ATTEMPTS = int(os.getenv("BOOTSTRAP_CONNECT_ATTEMPTS", "30"))
+CONNECT_DELAY = float(os.getenv("BOOTSTRAP_CONNECT_DELAY", "2"))
+
+
+def create_default_roles(db):
+    for role_name in DEFAULT_ROLES:
+        if not crud.get_role_by_name(db, role_name):
+            print(f"Creating default role: {role_name}")
+            db.add(models.Role(name=role_name))
+    db.commit()
+
+
+def create_superadmin(db):
+    if crud.get_user_by_username(db, SUPERADMIN_USERNAME):
+        return
+    role = crud.get_role_by_name(db, "Superadmin")
+    db.add(models.User(
+        username=SUPERADMIN_USERNAME,
+        password_hash=crud.get_password_hash(SUPERADMIN_PASSWORD),
+        role_id=role.role_id,
+    ))
+    db.commit()
+    print("[✅] Superadmin user created.")
+
+
+def connect():
+    for attempt in range(1, CONNECT_ATTEMPTS + 1):
+        try:
+            return engine.connect()
+        except OperationalError as e:
+            if attempt == CONNECT_ATTEMPTS:
+                raise
+            print(f"Database not reachable (attempt {attempt}), retrying in {CONNECT_DELAY}s: {e}")
+            time.sleep(CONNECT_DELAY)
+
+
+def bootstrap():
+    connection = connect()
+    locked = connection.dialect.name == "postgresql"
+    try:
+        if locked:
+            # Session-level lock, taken before any DDL so concurrent runs can't race
+            # on CREATE TABLE; it stays held across the commits below
+            with connection.begin():
+                connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
+        with connection.begin():
+            models.Base.metadata.create_all(bind=connection)
+        db = SessionLocal(bind=connection)
+        try:
+            create_default_roles(db)
+            create_superadmin(db)
+        except IntegrityError:
+            # Another run without the lock (e.g. SQLite) inserted the same rows first
+            db.rollback()
+            print("Bootstrap rows already present")
+        finally:
+            db.close()
+    finally:
+        if locked:
+            # The connection goes back to the pool, which wouldn't release the lock
+            with connection.begin():
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
+        connection.close()
+
+
+if __name__ == "__main__":
+    bootstrap()
@@ -1,10 +1,14 @@
-from app import models
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from app import models, user_cache
+from app.hashing import pwd_context
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload
+import hashlib
+import os
 import secrets
 from datetime import datetime, timedelta
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -25,31 +29,83 @@ def create_role(db: Session, name: str) -> models.Role:
 def get_user_by_username(db: Session, username: str) -> models.User | None:
     return db.query(models.User).filter(models.User.username == username).first()
 
+def get_user_with_role(db: Session, username: str) -> models.User | None:
+    """The user with its role loaded in the same query, for use outside the session's thread."""
+    return (
+        db.query(models.User)
+        .options(joinedload(models.User.role))
+        .filter(models.User.username == username)
+        .first()
+    )
+
+def update_password_hash(db: Session, user: models.User, password_hash: str):
+    username = user.username
+    user.password_hash = password_hash
+    db.commit()
+    user_cache.invalidate(username)
+
 def create_user(
     db: Session,
     username: str,
-    plain_password: str,
+    password_hash: str,
     role_name: str
 ) -> models.User:
+    """
+    Insert a user whose password has already been hashed (see app.hashing,
+    which does it off the event loop).
+    """
     # 1. Find the Role row
     role_obj = get_role_by_name(db, role_name)
     if not role_obj:
         raise ValueError(f"Role '{role_name}' does not exist.")
 
-    # 2. Hash the password
-    hashed_pw = pwd_context.hash(plain_password)
-
-    # 3. Insert into users
+    # 2. Insert into users
     db_user = models.User(
         username=username,
-        password_hash=hashed_pw,
+        password_hash=password_hash,
         role_id=role_obj.role_id
     )
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    # Load the role now, while still on the session's thread
+    db_user.role
     return db_user
 
+def get_roles_by_name(db: Session, names) -> dict[str, models.Role]:
+    """Roles for the given names in one query, keyed by name."""
+    return {role.name: role for role in db.query(models.Role).filter(models.Role.name.in_(list(names)))}
+
+def existing_usernames(db: Session, usernames) -> set[str]:
+    return {
+        username for (username,) in db.query(models.User.username).filter(models.User.username.in_(list(usernames)))
+    }
+
+def bulk_create_users(db: Session, rows: list[dict]) -> set[str]:
+    """
+    Insert users (username, password_hash, role_id) in one statement and
+    commit. Usernames taken in the meantime are skipped rather than failing
+    the batch; returns the usernames actually inserted.
+    """
+    if not rows:
+        return set()
+    now = datetime.utcnow()
+    rows = [dict(row, created_at=now, updated_at=now) for row in rows]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = (
+            dialect_insert(models.User.__table__)
+            .on_conflict_do_nothing(index_elements=["username"])
+            .returning(models.User.__table__.c.username)
+        )
+        created = {username for (username,) in db.execute(stmt, rows)}
+    else:
+        db.execute(insert(models.User.__table__), rows)
+        created = {row["username"] for row in rows}
+    db.commit()
+    return created
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -74,8 +130,91 @@ def reset_password_with_token(db: Session, token: str, new_password: str) -> boo
     user = db.query(models.User).filter(models.User.reset_token == token).first()
     if not user or not user.reset_token_expiry or user.reset_token_expiry < datetime.utcnow():
         return False
+    username = user.username
     user.password_hash = pwd_context.hash(new_password)
     user.reset_token = None
     user.reset_token_expiry = None
+    revoke_user_refresh_tokens(db, user.user_id)
+    db.commit()
+    user_cache.invalidate(username)
+    return True
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue_refresh_token(db: Session, user_id: int, family_id: str | None = None) -> str:
+    """
+    Create a refresh token for the user and return it; only its hash is stored.
+    Call db.commit() afterwards.
+    """
+    token = secrets.token_urlsafe(32)
+    db.add(models.RefreshToken(
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or secrets.token_hex(16),
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+def create_refresh_token(db: Session, user_id: int) -> str:
+    """Start a new token family, e.g. at login."""
+    token = issue_refresh_token(db, user_id)
+    db.commit()
+    return token
+
+def rotate_refresh_token(db: Session, token: str) -> tuple[str, str, str]:
+    """
+    Exchange a refresh token for its successor. Returns (username, role_name,
+    new_token); raises ValueError if the token is unknown, expired or already
+    used. Reusing a rotated token revokes its whole family, since one of
+    the two holders must have stolen it.
+    """
+    now = datetime.utcnow()
+    row = (
+        db.query(models.RefreshToken)
+        .options(joinedload(models.RefreshToken.user).joinedload(models.User.role))
+        .filter(models.RefreshToken.token_hash == hash_refresh_token(token))
+        .first()
+    )
+    if not row or row.expires_at <= now:
+        raise ValueError("Invalid or expired refresh token")
+
+    # Conditional update, so two concurrent uses of one token can't both succeed
+    claimed = (
+        db.query(models.RefreshToken)
+        .filter(models.RefreshToken.token_id == row.token_id, models.RefreshToken.revoked_at.is_(None))
+        .update({models.RefreshToken.revoked_at: now}, synchronize_session=False)
+    )
+    if not claimed:
+        revoke_refresh_token_family(db, row.family_id)
+        db.commit()
+        raise ValueError("Refresh token has already been used")
+
+    user = row.user
+    username, role_name = user.username, user.role.name
+    new_token = issue_refresh_token(db, user.user_id, row.family_id)
+    db.commit()
+    return username, role_name, new_token
+
+def revoke_refresh_token_family(db: Session, family_id: str):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.family_id == family_id,
+        models.RefreshToken.revoked_at.is_(None),
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+def revoke_refresh_token(db: Session, token: str) -> bool:
+    """Revoke the token and every token rotated from the same login."""
+    row = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == hash_refresh_token(token)
+    ).first()
+    if not row:
+        return False
+    revoke_refresh_token_family(db, row.family_id)
     db.commit()
     return True
+
+def revoke_user_refresh_tokens(db: Session, user_id: int):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.user_id == user_id,
+        models.RefreshToken.revoked_at.is_(None),
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
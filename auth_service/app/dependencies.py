@@ -8,7 +8,7 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
-from . import crud, models, schemas
+from . import crud, models, schemas, user_cache
 from .database import SessionLocal
 
 # Must match the Payables Service's SECRET_KEY / ALGORITHM
@@ -53,7 +53,16 @@ def get_current_user(
     db: Session = Depends(get_db),
 ) -> models.User:
     token_data = decode_access_token(token)
-    user = crud.get_user_by_username(db, token_data.username)
+
+    def load(username: str) -> models.User | None:
+        # One query for the user and its role, then detach it so it can be shared
+        user = crud.get_user_with_role(db, username)
+        if user is not None:
+            db.expunge(user.role)
+            db.expunge(user)
+        return user
+
+    user = user_cache.get_or_load(token_data.username, load)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -0,0 +1,133 @@
+# auth_service/hashing.py
+
+"""
+Password hashing off the event loop.
+
+bcrypt is deliberately slow and holds the GIL, so hashes and verifications run
+on a dedicated process pool sized to the CPU count. Admission is bounded: once
+every worker is busy and the queue is full, callers get PasswordHasherBusy
+straight away (served as a 503) instead of piling up behind a login burst and
+starving the rest of the service.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+# bcrypt cost factor for new hashes; stored hashes with a lower cost are
+# upgraded the next time their owner logs in
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# By default the cores are shared between the uvicorn workers (WEB_CONCURRENCY)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))))
+# Requests allowed to wait for a worker before new ones are turned away
+HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", str(HASH_WORKERS * 4)))
+# Passwords per bulk task; a login queued behind a bulk job waits for at most one
+BULK_CHUNK_SIZE = int(os.getenv("PASSWORD_HASH_BULK_CHUNK_SIZE", "4"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+_pool = None
+_admitted = 0
+_bulk_lock = None
+
+
+class PasswordHasherBusy(Exception):
+    """Every hashing worker is busy and the admission queue is full."""
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password: str, password_hash: str):
+    """(valid, new_hash) - new_hash is set when the stored hash should be replaced."""
+    return pwd_context.verify_and_update(password, password_hash)
+
+
+def _warm() -> str:
+    """Load passlib's bcrypt backend; runs in each pool worker at startup."""
+    return pwd_context.handler().get_backend()
+
+
+def _warmed(future):
+    if future.cancelled():
+        return
+    if future.exception() is not None:
+        print(f"Password hashing worker failed to start: {future.exception()!r}")
+
+
+def start_pool():
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that already runs threads is not safe
+        _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        # Start the workers and load bcrypt now rather than on the first login
+        for _ in range(HASH_WORKERS):
+            _pool.submit(_warm).add_done_callback(_warmed)
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _run(fn, *args):
+    global _admitted
+    if _admitted >= HASH_WORKERS + HASH_QUEUE_SIZE:
+        raise PasswordHasherBusy()
+    _admitted += 1
+    try:
+        # Without a pool (scripts, tests) fall back to the default thread pool
+        return await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+    finally:
+        _admitted -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def hash_passwords_async(passwords) -> list:
+    """
+    Hash many passwords in parallel across the pool's workers, in order. Bulk
+    jobs bypass admission but run one at a time, and keep at most one small
+    chunk per worker in the pool's queue: the next chunk is submitted only as
+    one finishes, so logins arriving meanwhile are queued ahead of the rest of
+    the job instead of behind all of it.
+    """
+    global _bulk_lock
+    if _bulk_lock is None:
+        _bulk_lock = asyncio.Lock()
+    passwords = list(passwords)
+    async with _bulk_lock:
+        loop = asyncio.get_running_loop()
+        if _pool is None:
+            return await loop.run_in_executor(None, _hash_chunk, passwords)
+        chunks = [passwords[i:i + BULK_CHUNK_SIZE] for i in range(0, len(passwords), BULK_CHUNK_SIZE)]
+        results = [None] * len(chunks)
+        pending = iter(enumerate(chunks))
+
+        async def feed():
+            for index, chunk in pending:
+                results[index] = await loop.run_in_executor(_pool, _hash_chunk, chunk)
+
+        await asyncio.gather(*(feed() for _ in range(min(HASH_WORKERS, len(chunks)))))
+        return [password_hash for chunk in results for password_hash in chunk]
+
+
+def _hash_chunk(passwords) -> list:
+    return [hash_password(password) for password in passwords]
+
+
+async def verify_and_update_async(password: str, password_hash: str):
+    return await _run(verify_and_update, password, password_hash)
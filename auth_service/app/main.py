@@ -1,12 +1,10 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from app.crud import get_password_hash
+import os
 
-from . import models, schemas, crud, dependencies
-from .database import SessionLocal, engine
-
-# Create all tables if they don't exist yet (roles + users)
-models.Base.metadata.create_all(bind=engine)
+from . import models, schemas, crud, dependencies, hashing, user_cache, bootstrap
 
 from fastapi import Security
 from .dependencies import get_current_user,get_db, create_access_token  # Assuming you have this
@@ -15,6 +13,29 @@ from fastapi.openapi.utils import get_openapi
 
 app = FastAPI(title="Auth Service")
 
+# Tables, default roles and the superadmin are set up by `python -m app.bootstrap`
+# before the workers start. Set AUTH_BOOTSTRAP_ON_STARTUP for single-process
+# development runs (e.g. uvicorn --reload) that skip that step.
+BOOTSTRAP_ON_STARTUP = os.getenv("AUTH_BOOTSTRAP_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+@app.on_event("startup")
+def start_password_hasher():
+    if BOOTSTRAP_ON_STARTUP:
+        bootstrap.bootstrap()
+    hashing.start_pool()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    hashing.shutdown_pool()
+
+@app.exception_handler(hashing.PasswordHasherBusy)
+async def password_hasher_busy(request: Request, exc: hashing.PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many sign-in requests in progress, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
 @app.put("/users/{username}/role")
 def update_user_role(
     username: str,
@@ -40,55 +61,70 @@ def update_user_role(
     user.role_id = role.role_id
     db.commit()
     db.refresh(user)
+    user_cache.invalidate(username)
 
     return {"message": f"User '{username}' updated to role '{new_role}'"}
 
 
-# Function to create default roles if they don't exist
-def create_default_roles():
-    db = None
-    try:
-        db = SessionLocal() # Use the sessionmaker from database.py
-        default_roles = ["Volunteer", "Admin", "Superadmin"]
-        for role_name in default_roles:
-            existing_role = crud.get_role_by_name(db, role_name)
-            if not existing_role:
-                print(f"Creating default role: {role_name}")
-                crud.create_role(db, role_name)
-    except Exception as e:
-        print(f"Error creating default roles: {e}")
-    finally:
-        if db:
-            db.close()
-
-# Call this function after creating tables
-create_default_roles()
-def create_superadmin():
-    db = SessionLocal()
-    try:
-        username = "superadmin@gmail.com"
-        password = "12345"
-
-        # Ensure Superadmin role exists
-        role = crud.get_role_by_name(db, "Superadmin")
-        if not role:
-            role = crud.create_role(db, "Superadmin")
-
-        # Check if user already exists
-        existing = crud.get_user_by_username(db, username)
-        if not existing:
-            hashed_pw = get_password_hash(password)
-            db_user = models.User(username=username, password_hash=hashed_pw, role_id=role.role_id)
-            db.add(db_user)
-            db.commit()
-            print("[✅] Superadmin user created.")
-    finally:
-        db.close()
-create_superadmin()
+# Largest user list accepted by POST /users/bulk
+BULK_USERS_MAX = int(os.getenv("BULK_USERS_MAX", "5000"))
+
+@app.post("/users/bulk", response_model=schemas.BulkUserResponse)
+async def bulk_create_users(
+    payload: schemas.BulkUserCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Provision many users at once (admin and superadmin only). Rows with an
+    unknown role, a username that already exists or repeats an earlier row are
+    reported by row number; the rest are hashed in parallel on the password
+    pool and inserted in one transaction.
+    """
+    caller_role = current_user.role.name.lower()
+    if caller_role not in ("admin", "superadmin"):
+        raise HTTPException(status_code=403, detail="Only admins can provision users")
+    if len(payload.users) > BULK_USERS_MAX:
+        raise HTTPException(status_code=413, detail=f"Bulk provisioning is limited to {BULK_USERS_MAX} users")
+
+    usernames = [user.username for user in payload.users]
+    roles = await run_in_threadpool(crud.get_roles_by_name, db, {user.role_name for user in payload.users})
+    existing = await run_in_threadpool(crud.existing_usernames, db, usernames)
+
+    errors = []
+    accepted = []
+    seen = set()
+    for row, user in enumerate(payload.users, start=1):
+        role = roles.get(user.role_name)
+        if role is None:
+            error = f"Role '{user.role_name}' does not exist"
+        elif role.name.lower() == "superadmin" and caller_role != "superadmin":
+            error = "Only superadmin can assign the Superadmin role"
+        elif user.username in existing:
+            error = "Username already registered"
+        elif user.username in seen:
+            error = "Duplicate username in this request"
+        else:
+            seen.add(user.username)
+            accepted.append((row, user, role))
+            continue
+        errors.append({"row": row, "username": user.username, "error": error})
+
+    password_hashes = await hashing.hash_passwords_async(user.password for _, user, _ in accepted)
+    created = await run_in_threadpool(crud.bulk_create_users, db, [
+        {"username": user.username, "password_hash": password_hash, "role_id": role.role_id}
+        for (_, user, role), password_hash in zip(accepted, password_hashes)
+    ])
+    # Anything not inserted was registered by someone else after the existence check
+    for row, user, _ in accepted:
+        if user.username not in created:
+            errors.append({"row": row, "username": user.username, "error": "Username already registered"})
+    errors.sort(key=lambda error: error["row"])
+    return {"created": len(created), "failed": len(errors), "errors": errors}
 
 
 @app.post("/auth/register", response_model=schemas.Token)
-def register_user(
+async def register_user(
     user_in: schemas.UserCreate,
     db: Session = Depends(dependencies.get_db),
 ):
@@ -102,25 +138,28 @@ def register_user(
     Returns: { "access_token": "<JWT>", "token_type": "bearer" }
     """
     # 1. Ensure the username is not already taken
-    existing = crud.get_user_by_username(db, user_in.username)
+    existing = await run_in_threadpool(crud.get_user_by_username, db, user_in.username)
     if existing:
         raise HTTPException(status_code=400, detail="Username already registered")
 
-    # 2. Create the user (ValueError if role_name doesn't exist)
+    # 2. Hash on the password pool, then create the user (ValueError if role_name doesn't exist)
+    password_hash = await hashing.hash_password_async(user_in.password)
     try:
-        user = crud.create_user(db, user_in.username, user_in.password, user_in.role_name)
+        user = await run_in_threadpool(crud.create_user, db, user_in.username, password_hash, user_in.role_name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     # 3. Issue JWT with "sub" = username and "role_name" = user.role.name
+    username, role_name = user.username, user.role.name
     access_token = dependencies.create_access_token(
-        data={"sub": user.username, "role_name": user.role.name}
+        data={"sub": username, "role_name": role_name}
     )
-    return {"access_token": access_token, "token_type": "bearer", "role_name": user.role.name}
+    refresh_token = await run_in_threadpool(crud.create_refresh_token, db, user.user_id)
+    return {"access_token": access_token, "token_type": "bearer", "role_name": role_name, "refresh_token": refresh_token}
 
 
 @app.post("/auth/login", response_model=schemas.Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: schemas.UserLogin,  # Changed from UserCreate to new UserLogin schema
     db: Session = Depends(dependencies.get_db),
 ):
@@ -132,18 +171,62 @@ def login_for_access_token(
       }
     Returns: { "access_token": "<JWT>", "token_type": "bearer" }
     """
-    user = crud.get_user_by_username(db, form_data.username)
-    if not user or not crud.verify_password(form_data.password, user.password_hash):
+    user = await run_in_threadpool(crud.get_user_with_role, db, form_data.username)
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await hashing.verify_and_update_async(form_data.password, user.password_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    role_name = user.role.name
+    user_id, username, role_name = user.user_id, user.username, user.role.name
+    if new_hash:
+        # Stored with an older scheme or lower cost; upgrade it now that we know the password
+        await run_in_threadpool(crud.update_password_hash, db, user, new_hash)
     access_token = dependencies.create_access_token(
-        data={"sub": user.username, "role_name": user.role.name}
+        data={"sub": username, "role_name": role_name}
     )
-    return {"access_token": access_token, "token_type": "bearer","role_name": role_name }
+    refresh_token = await run_in_threadpool(crud.create_refresh_token, db, user_id)
+    return {"access_token": access_token, "token_type": "bearer","role_name": role_name, "refresh_token": refresh_token}
+
+
+@app.post("/auth/refresh", response_model=schemas.Token)
+def refresh_access_token(
+    request: schemas.RefreshRequest,
+    db: Session = Depends(dependencies.get_db),
+):
+    """
+    Exchange a refresh token for a new access token and a new refresh token,
+    without a password. Each refresh token works once; the old one is revoked.
+    Expects payload:
+      {
+        "refresh_token": "<string>"
+      }
+    """
+    try:
+        username, role_name, refresh_token = crud.rotate_refresh_token(db, request.refresh_token)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    access_token = dependencies.create_access_token(
+        data={"sub": username, "role_name": role_name}
+    )
+    return {"access_token": access_token, "token_type": "bearer", "role_name": role_name, "refresh_token": refresh_token}
+
+
+@app.post("/auth/logout")
+def logout(
+    request: schemas.RefreshRequest,
+    db: Session = Depends(dependencies.get_db),
+):
+    """Revoke a refresh token together with every token rotated from the same login."""
+    crud.revoke_refresh_token(db, request.refresh_token)
+    return {"message": "Logged out"}
 
 def custom_openapi():
     if app.openapi_schema:
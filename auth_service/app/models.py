@@ -24,3 +24,21 @@ class User(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     role = relationship("Role")
+
+class RefreshToken(Base):
+    """
+    Opaque refresh token, stored only as its SHA-256 hash. Each use revokes the
+    token and issues a successor in the same family; presenting a revoked token
+    again revokes the whole family.
+    """
+    __tablename__ = "refresh_tokens"
+
+    token_id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    family_id = Column(String(32), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.user_id"), index=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    user = relationship("User")
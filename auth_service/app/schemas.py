@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -10,6 +10,19 @@ class UserCreate(BaseModel):
     password: str
     role_name: str
 
+class BulkUserCreate(BaseModel):
+    users: List[UserCreate]
+
+class BulkUserError(BaseModel):
+    row: int
+    username: str
+    error: str
+
+class BulkUserResponse(BaseModel):
+    created: int
+    failed: int
+    errors: List[BulkUserError]
+
 class UserLogin(BaseModel):
     username: str
     password: str
@@ -26,6 +39,10 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     role_name: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
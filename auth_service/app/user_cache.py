@@ -0,0 +1,62 @@
+# auth_service/user_cache.py
+
+"""
+In-process TTL/LRU cache of users (with their role) for get_current_user.
+
+Entries are detached ORM objects with the role loaded eagerly, so a cache hit
+needs no database round-trip. Writes that change a user call invalidate();
+other workers pick the change up when their entry expires, so keep
+USER_CACHE_TTL short.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+
+_entries = OrderedDict()
+_generation = 0
+_lock = threading.Lock()
+
+
+def get_or_load(username: str, load):
+    """
+    The cached user, or load(username) on a miss. None results are not cached.
+    A result loaded while an invalidation ran is returned but not stored.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(username)
+        if entry is not None:
+            if entry[0] > now:
+                _entries.move_to_end(username)
+                return entry[1]
+            del _entries[username]
+        generation = _generation
+
+    user = load(username)
+    if user is None:
+        return None
+    with _lock:
+        if generation == _generation:
+            _entries[username] = (now + USER_CACHE_TTL, user)
+            _entries.move_to_end(username)
+            while len(_entries) > USER_CACHE_SIZE:
+                _entries.popitem(last=False)
+    return user
+
+
+def invalidate(username: str):
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.pop(username, None)
+
+
+def clear():
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.clear()
@@ -0,0 +1,93 @@
+"""
+Per-request overhead added by the API gateway.
+
+Sends the same GET straight to an upstream service and through the gateway,
+with --concurrency requests in flight, and prints the latency of each path and
+the difference. Run it against a gateway build before and after a change to
+see what the proxy hop costs.
+
+    JWT_SECRET_KEY=... python benchmarks/gateway_overhead.py \\
+        --gateway http://localhost:8000 --gateway-path /payables/invoices \\
+        --direct http://localhost:8002 --direct-path /invoices
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import jwt
+
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-auth-secret-key")
+
+
+def user_token():
+    payload = {"sub": "benchmark", "role_name": "Admin", "exp": datetime.utcnow() + timedelta(minutes=30)}
+    return jwt.encode(payload, JWT_SECRET_KEY, algorithm="HS256")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def measure(url, path, params, total, concurrency):
+    """Latencies in milliseconds for `total` GETs through one keep-alive client."""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {user_token()}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=60) as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path, params=params)
+                latencies.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+
+        # Warm up connections on both sides before timing
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+    return latencies, total / elapsed
+
+
+def report(label, latencies, rate):
+    print(
+        f"{label:8} {rate:8,.0f} req/s  p50 {statistics.median(latencies):6.1f}ms"
+        f"  p95 {percentile(latencies, 95):6.1f}ms  p99 {percentile(latencies, 99):6.1f}ms"
+    )
+
+
+async def run(args):
+    params = {"limit": args.limit}
+    direct, direct_rate = await measure(args.direct, args.direct_path, params, args.requests, args.concurrency)
+    gateway, gateway_rate = await measure(args.gateway, args.gateway_path, params, args.requests, args.concurrency)
+    print(f"{args.requests} requests per path, concurrency {args.concurrency}")
+    report("direct", direct, direct_rate)
+    report("gateway", gateway, gateway_rate)
+    print(
+        f"overhead p50 {statistics.median(gateway) - statistics.median(direct):+.1f}ms"
+        f"  p99 {percentile(gateway, 99) - percentile(direct, 99):+.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gateway", default="http://localhost:8000")
+    parser.add_argument("--gateway-path", default="/payables/invoices")
+    parser.add_argument("--direct", default="http://localhost:8002")
+    parser.add_argument("--direct-path", default="/invoices")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
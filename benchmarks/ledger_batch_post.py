@@ -0,0 +1,75 @@
+"""
+Throughput check for the ledger batch posting endpoint.
+
+Posts payroll-style journal entries (one expense debit per employee, one
+balancing bank credit) and reports ledger lines written per second.
+
+    python benchmarks/ledger_batch_post.py --url http://localhost:8003 --lines 100000
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import requests
+
+SERVICE_SECRET = os.getenv("SERVICE_SECRET", "shared-service-secret")
+
+
+def service_token():
+    payload = {"service": "benchmark", "exp": datetime.utcnow() + timedelta(minutes=30)}
+    return jwt.encode(payload, SERVICE_SECRET, algorithm="HS256")
+
+
+def payroll_entry(employees, project_id):
+    lines = [
+        {
+            "account": "6100-salaries",
+            "type": "debit",
+            "amount": 1250.0,
+            "description": f"Salary employee {n}",
+            "project_id": project_id,
+        }
+        for n in range(employees)
+    ]
+    lines.append({
+        "account": "1000-bank",
+        "type": "credit",
+        "amount": 1250.0 * employees,
+        "description": "Payroll run",
+        "project_id": project_id,
+    })
+    return {"entries": lines}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8003")
+    parser.add_argument("--lines", type=int, default=100000, help="total ledger lines to post")
+    parser.add_argument("--batch-lines", type=int, default=10000, help="lines per HTTP request")
+    parser.add_argument("--employees", type=int, default=49, help="debit lines per journal entry")
+    args = parser.parse_args()
+
+    lines_per_entry = args.employees + 1
+    entries_per_batch = max(1, args.batch_lines // lines_per_entry)
+    batch = {"journal_entries": [payroll_entry(args.employees, "BENCH") for _ in range(entries_per_batch)]}
+    lines_per_batch = entries_per_batch * lines_per_entry
+    batches = max(1, args.lines // lines_per_batch)
+
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {service_token()}"
+    url = f"{args.url}/api/v1/ledger/journal-entries/batch"
+
+    started = time.perf_counter()
+    for _ in range(batches):
+        response = session.post(url, json=batch)
+        response.raise_for_status()
+    elapsed = time.perf_counter() - started
+
+    total = batches * lines_per_batch
+    print(f"{total} lines in {elapsed:.2f}s -> {total / elapsed:,.0f} lines/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Latency under concurrent load for the ledger read endpoints.
+
+Fires --requests GETs with --concurrency in flight at once and prints p50/p95/p99,
+counting errors and timeouts as failed requests rather than stopping. Run it
+against a build before and after a change to compare tail latency.
+
+    python benchmarks/ledger_latency.py --url http://localhost:8003 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import jwt
+
+SERVICE_SECRET = os.getenv("SERVICE_SECRET", "shared-service-secret")
+
+
+def service_token():
+    payload = {"service": "benchmark", "exp": datetime.utcnow() + timedelta(minutes=30)}
+    return jwt.encode(payload, SERVICE_SECRET, algorithm="HS256")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(url, path, params, total, concurrency):
+    latencies = []
+    failures = []
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {service_token()}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=60) as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path, params=params)
+                    response.raise_for_status()
+                except httpx.HTTPError as e:
+                    failures.append(e)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    ms = [l * 1000 for l in latencies]
+    print(f"{total} requests, concurrency {concurrency}, {total / elapsed:,.0f} req/s")
+    print(f"p50 {statistics.median(ms):.1f}ms  p95 {percentile(ms, 95):.1f}ms  p99 {percentile(ms, 99):.1f}ms")
+    if failures:
+        print(f"{len(failures)} failed, e.g. {failures[0]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8003")
+    parser.add_argument("--path", default="/api/v1/ledger/transactions")
+    parser.add_argument("--project-id", default="BENCH")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.path, {"project_id": args.project_id}, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
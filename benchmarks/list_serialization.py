@@ -0,0 +1,99 @@
+"""
+Rows/sec for encoding invoice and ledger entry lists, comparing FastAPI's
+response_model path (validate into Pydantic models, dump to JSON-able data,
+json.dumps) with the orjson fast path enabled by FAST_JSON_RESPONSES.
+
+Runs in-process on synthetic ORM-like rows, so no database is needed:
+
+    python benchmarks/list_serialization.py --rows 1000 --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "payables-service"), os.path.join(ROOT, "ledger_service")]
+
+from pydantic import TypeAdapter  # noqa: E402
+
+import fast_json  # noqa: E402
+import ledger_json  # noqa: E402
+import schemas  # noqa: E402
+from ledger_schemas import EntryOut  # noqa: E402
+
+
+def invoice_rows(count):
+    return [
+        SimpleNamespace(
+            invoice_id=f"INV{i:07d}", vendor_name="Acme Supplies", vendor_email="billing@acme.example",
+            vendor_number="V100", invoice_date=date(2026, 1, 1), due_date=date(2026, 2, 1),
+            amount=Decimal("1234.5600"), payment_method="bank", payment_status="Unpaid",
+            created_by="clerk@example.org", status="Posted", expense_account="6000",
+            payable_account="2000", project_id="P1", expense_account_code="6000", payable_account_code="2000",
+        )
+        for i in range(count)
+    ]
+
+
+def entry_rows(count):
+    return [
+        SimpleNamespace(
+            id=i, account="6000", type="debit" if i % 2 else "credit", amount=Decimal("1234.5600"),
+            description=f"Invoice INV{i:07d} expense", project_id="P1",
+            posted_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+        )
+        for i in range(count)
+    ]
+
+
+def response_model_path(model):
+    adapter = TypeAdapter(List[model])
+
+    def encode(rows):
+        validated = adapter.validate_python(rows, from_attributes=True)
+        content = adapter.dump_python(validated, mode="json")
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+    return encode
+
+
+def measure(name, encode, rows, repeat):
+    encode(rows)  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = encode(rows)
+    elapsed = time.perf_counter() - started
+    rate = len(rows) * repeat / elapsed
+    print(f"  {name:<16} {rate:>12,.0f} rows/s  ({len(body):,} bytes per page)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000, help="rows per page")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if fast_json.orjson is None:
+        print("orjson is not installed; the fast path falls back to json.dumps")
+
+    cases = [
+        ("invoices", invoice_rows(args.rows), schemas.InvoiceResponse,
+         lambda rows: fast_json.dumps([fast_json.invoice_to_dict(r) for r in rows])),
+        ("ledger entries", entry_rows(args.rows), EntryOut,
+         lambda rows: ledger_json.dumps([ledger_json.entry_to_dict(r) for r in rows])),
+    ]
+    for label, rows, model, fast in cases:
+        print(f"{label}, {args.rows} rows per page:")
+        before = measure("response_model", response_model_path(model), rows, args.repeat)
+        after = measure("orjson", fast, rows, args.repeat)
+        print(f"  speed-up {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
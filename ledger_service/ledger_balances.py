@@ -0,0 +1,252 @@
+"""
+Per-account, per-project running balances.
+
+Every posting calls apply_balance_deltas() in the same transaction that inserts
+its ledger lines, so account_balances always agrees with ledger_entries and a
+trial balance is a scan of account_balances rather than of every entry.
+
+Closing a period writes cumulative per-account snapshots to balance_snapshots;
+a point-in-time balance is then the latest snapshot plus the entries posted
+since it, rather than a scan of the whole history.
+
+Rebuild or verify the table from ledger_entries with:
+
+    python ledger_balances.py rebuild [--check]
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import case, func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ledger_db import SessionLocal
+from ledger_models import AccountBalance, BalanceSnapshot, LedgerEntry, LedgerPeriod
+from ledger_money import from_minor_units, to_minor_units
+
+NO_PROJECT = ""
+
+
+def aggregate_deltas(lines) -> list:
+    """
+    Collapse ledger lines into one row per (account, project_id), sorted by key so
+    concurrent postings touching the same accounts lock rows in the same order.
+    Totals are summed as int64 minor units, so they are exact.
+    """
+    if not lines:
+        return []
+    keys = [(line["account"], line["project_id"] or NO_PROJECT) for line in lines]
+    unique_keys = sorted(set(keys))
+    slot_of = {key: slot for slot, key in enumerate(unique_keys)}
+    slots = np.fromiter((slot_of[key] for key in keys), dtype=np.int64, count=len(keys))
+    is_debit = np.fromiter((line["type"] == "debit" for line in lines), dtype=bool, count=len(lines))
+    amounts = to_minor_units((line["amount"] for line in lines), count=len(lines))
+
+    debits = np.zeros(len(unique_keys), dtype=np.int64)
+    credits = np.zeros(len(unique_keys), dtype=np.int64)
+    np.add.at(debits, slots[is_debit], amounts[is_debit])
+    np.add.at(credits, slots[~is_debit], amounts[~is_debit])
+    return [
+        {
+            "account": account,
+            "project_id": project_id,
+            "debit_total": from_minor_units(debit),
+            "credit_total": from_minor_units(credit),
+        }
+        for (account, project_id), debit, credit in zip(unique_keys, debits, credits)
+    ]
+
+
+def apply_balance_deltas(db: Session, lines) -> None:
+    """Add the totals of the given ledger lines to account_balances without committing."""
+    rows = aggregate_deltas(lines)
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(AccountBalance.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["account", "project_id"],
+            set_={
+                "debit_total": AccountBalance.__table__.c.debit_total + stmt.excluded.debit_total,
+                "credit_total": AccountBalance.__table__.c.credit_total + stmt.excluded.credit_total,
+            },
+        )
+        db.execute(stmt, rows)
+        return
+
+    # No native upsert: lock and update row by row
+    for row in rows:
+        balance = (
+            db.query(AccountBalance)
+            .filter_by(account=row["account"], project_id=row["project_id"])
+            .with_for_update()
+            .first()
+        )
+        if balance is None:
+            db.add(AccountBalance(**row))
+        else:
+            balance.debit_total += row["debit_total"]
+            balance.credit_total += row["credit_total"]
+    db.flush()
+
+
+def as_utc(moment: datetime) -> datetime:
+    """Treat naive timestamps (as SQLite returns them) as UTC so they compare with aware ones."""
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+def activity_between(db: Session, after: datetime = None, up_to: datetime = None) -> dict:
+    """
+    Totals of entries posted in (after, up_to], keyed by (account, project_id).
+    With no bounds this recomputes every balance from ledger_entries.
+    """
+    project = func.coalesce(LedgerEntry.project_id, NO_PROJECT)
+    query = db.query(
+        LedgerEntry.account,
+        project,
+        func.sum(case((LedgerEntry.type == "debit", LedgerEntry.amount), else_=0)),
+        func.sum(case((LedgerEntry.type == "credit", LedgerEntry.amount), else_=0)),
+    )
+    if after is not None:
+        query = query.filter(LedgerEntry.posted_at > after)
+    if up_to is not None:
+        query = query.filter(LedgerEntry.posted_at <= up_to)
+    rows = query.group_by(LedgerEntry.account, project).all()
+    return {(account, project_id): (debit or 0, credit or 0) for account, project_id, debit, credit in rows}
+
+
+def compute_balances(db: Session) -> dict:
+    """Recompute every balance from ledger_entries, keyed by (account, project_id)."""
+    return activity_between(db)
+
+
+def add_totals(base: dict, delta: dict) -> dict:
+    totals = dict(base)
+    for key, (debit, credit) in delta.items():
+        base_debit, base_credit = totals.get(key, (0, 0))
+        totals[key] = (base_debit + debit, base_credit + credit)
+    return totals
+
+
+def latest_period_end(db: Session, at_or_before: datetime = None):
+    query = db.query(func.max(LedgerPeriod.period_end))
+    if at_or_before is not None:
+        query = query.filter(LedgerPeriod.period_end <= at_or_before)
+    period_end = query.scalar()
+    return as_utc(period_end) if period_end is not None else None
+
+
+def snapshot_totals(db: Session, period_end) -> dict:
+    if period_end is None:
+        return {}
+    snapshots = db.query(BalanceSnapshot).filter(BalanceSnapshot.period_end == period_end).all()
+    return {(s.account, s.project_id): (s.debit_total, s.credit_total) for s in snapshots}
+
+
+def close_period(db: Session, period_end: datetime) -> dict:
+    """
+    Snapshot cumulative balances as of period_end: the previous snapshot plus only
+    the entries posted since it, so closing costs one period's activity. The
+    caller must hold the posting lock so nothing can still land before period_end.
+    """
+    previous = latest_period_end(db)
+    if previous is not None and period_end <= previous:
+        raise ValueError(f"Periods up to {previous.isoformat()} are already closed")
+
+    totals = add_totals(snapshot_totals(db, previous), activity_between(db, previous, period_end))
+    db.add(LedgerPeriod(period_end=period_end))
+    db.flush()
+    db.bulk_insert_mappings(BalanceSnapshot, [
+        {"period_end": period_end, "account": account, "project_id": project_id,
+         "debit_total": debit, "credit_total": credit}
+        for (account, project_id), (debit, credit) in totals.items()
+    ])
+    return {"period_end": period_end, "previous_period_end": previous, "accounts": len(totals)}
+
+
+def balances_as_of(db: Session, as_of: datetime):
+    """
+    Balances keyed by (account, project_id) for everything posted up to as_of:
+    the latest snapshot at or before as_of plus the entries posted after it.
+    Returns the snapshot's period_end (or None) along with the totals.
+    """
+    period_end = latest_period_end(db, at_or_before=as_of)
+    totals = add_totals(snapshot_totals(db, period_end), activity_between(db, period_end, as_of))
+    return period_end, totals
+
+
+def fold_by_account(totals: dict, project_id: str = None) -> list:
+    """Sum (account, project_id) totals per account, optionally for one project only."""
+    per_account = {}
+    for (account, project), (debit, credit) in totals.items():
+        if project_id is not None and project != project_id:
+            continue
+        base_debit, base_credit = per_account.get(account, (0, 0))
+        per_account[account] = (base_debit + debit, base_credit + credit)
+    return [(account, debit, credit) for account, (debit, credit) in sorted(per_account.items())]
+
+
+def rebuild_balances(db: Session, check_only: bool = False) -> list:
+    """
+    Compare account_balances with a fresh aggregate of ledger_entries and return
+    the mismatching keys. Unless check_only is set, the table is replaced with the
+    recomputed totals in the same transaction.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # Wait for in-flight postings and hold new ones back until we commit
+        db.execute(text("LOCK TABLE account_balances IN EXCLUSIVE MODE"))
+
+    expected = compute_balances(db)
+    stored = {
+        (b.account, b.project_id): (b.debit_total, b.credit_total)
+        for b in db.query(AccountBalance).all()
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key, (0, 0))
+        have = stored.get(key, (0, 0))
+        if want != have:
+            mismatches.append({"account": key[0], "project_id": key[1], "expected": want, "stored": have})
+
+    if check_only:
+        db.rollback()
+        return mismatches
+
+    db.query(AccountBalance).delete()
+    db.bulk_insert_mappings(AccountBalance, [
+        {"account": account, "project_id": project_id, "debit_total": debit, "credit_total": credit}
+        for (account, project_id), (debit, credit) in expected.items()
+    ])
+    db.commit()
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the account_balances table")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild = subcommands.add_parser("rebuild", help="recompute balances from ledger_entries")
+    rebuild.add_argument("--check", action="store_true", help="only report mismatches, don't rewrite")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        mismatches = rebuild_balances(db, check_only=args.check)
+    finally:
+        db.close()
+
+    for m in mismatches:
+        print(f"Mismatch {m['account']}/{m['project_id'] or '-'}: expected {m['expected']}, stored {m['stored']}")
+    if args.check:
+        print(f"{len(mismatches)} mismatching balance(s)")
+        sys.exit(1 if mismatches else 0)
+    print(f"Balances rebuilt, {len(mismatches)} row(s) corrected")
+
+
+if __name__ == "__main__":
+    main()
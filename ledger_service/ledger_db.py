@@ -1,38 +1,84 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException
+import asyncio
 import os
-
-DATABASE_URL = os.getenv("DATABASE_URL")
+import random
 import time
-from sqlalchemy import create_engine
-from sqlalchemy.exc import OperationalError
-
-DATABASE_URL = "postgresql://fms_user:12345@db:5432/fms_db"
-
-max_retries = 10
-retry_interval = 5  # seconds
-
-for i in range(max_retries):
-    try:
-        engine = create_engine(DATABASE_URL)
-        conn = engine.connect()
-        conn.close()
-        print("Database connection successful")
-        break
-    except OperationalError as e:
-        print(f"Database connection failed ({i+1}/{max_retries}): {e}")
-        time.sleep(retry_interval)
-else:
-    raise Exception("Database connection failed after max retries.")
-
-engine = create_engine(DATABASE_URL)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://fms_user:12345@db:5432/fms_db")
+POOL_SIZE = int(os.getenv("LEDGER_DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("LEDGER_DB_MAX_OVERFLOW", "10"))
+
+# Backoff between attempts to reach the database at startup
+CONNECT_INITIAL_DELAY = float(os.getenv("LEDGER_DB_CONNECT_INITIAL_DELAY", "0.25"))
+CONNECT_MAX_DELAY = float(os.getenv("LEDGER_DB_CONNECT_MAX_DELAY", "15"))
+
+PROCESS_STARTED = time.monotonic()
+
+def engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        options.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW)
+    return options
+
+def to_async_url(url: str) -> str:
+    """Map a sync driver URL onto its asyncio driver (asyncpg for Postgres, aiosqlite for SQLite)."""
+    for sync_prefix, async_prefix in (
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+# Creating an engine does not open a connection; the first one is made when a
+# session or the startup task below checks one out of the pool.
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# Request handlers are async, so they use this engine to avoid blocking the event
+# loop; the sync engine above stays for command-line tools.
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Filled in by connect_with_backoff() and reported by /readyz
+readiness = {"ready": False, "attempts": 0, "last_error": None, "startup_seconds": None}
+
+async def connect_with_backoff(prepare):
+    """
+    Keep trying to reach the database, doubling the delay (with jitter) after each
+    failure, and run prepare(connection) to set up the schema once it answers.
+    Runs in the background so the worker can answer health checks while the
+    database is still coming up.
+    """
+    delay = CONNECT_INITIAL_DELAY
+    while True:
+        readiness["attempts"] += 1
+        try:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(prepare)
+        except Exception as e:
+            readiness["last_error"] = str(e)
+            print(f"Database connection failed (attempt {readiness['attempts']}), retrying in {delay:.2f}s: {e}")
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, CONNECT_MAX_DELAY)
+            continue
+        readiness["ready"] = True
+        readiness["last_error"] = None
+        readiness["startup_seconds"] = round(time.monotonic() - PROCESS_STARTED, 3)
+        print(f"Database ready after {readiness['startup_seconds']}s ({readiness['attempts']} attempt(s))")
+        return
+
+async def get_db():
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail="Database not ready")
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,53 @@
+"""
+Idempotency keys for journal postings. The key is stored with the response in
+the same transaction as the ledger lines, so a retried request either finds
+that response or posts for the first time - never twice.
+"""
+import hashlib
+import json
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ledger_models import IdempotencyKey
+from ledger_money import DECIMAL_PLACES
+
+AMOUNT_QUANTUM = Decimal(1).scaleb(-DECIMAL_PLACES)
+
+
+def canonical_amount(amount: Decimal) -> str:
+    """Amount at the stored scale without trailing zeros, so "10.25" and "10.2500" hash alike."""
+    return f"{amount.quantize(AMOUNT_QUANTUM).normalize():f}"
+
+
+def request_fingerprint(journal_entry) -> str:
+    """Stable hash of a journal entry's lines, ignoring the key itself."""
+    body = jsonable_encoder(
+        journal_entry.dict(exclude={"idempotency_key"}),
+        custom_encoder={Decimal: canonical_amount},
+    )
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+
+async def find_keys(db: AsyncSession, keys) -> dict:
+    """Recorded responses for the given keys, fetched in one query."""
+    keys = [k for k in keys if k]
+    if not keys:
+        return {}
+    result = await db.execute(select(IdempotencyKey).where(IdempotencyKey.key.in_(keys)))
+    return {row.key: row for row in result.scalars()}
+
+
+def record_key(db: AsyncSession, key: str, fingerprint: str, status_code: int, body: dict):
+    db.add(IdempotencyKey(
+        key=key,
+        request_hash=fingerprint,
+        status_code=status_code,
+        response_body=json.dumps(body),
+    ))
+
+
+def recorded_body(row: IdempotencyKey) -> dict:
+    return json.loads(row.response_body)
@@ -0,0 +1,63 @@
+"""
+JSON encoding for entry lists. With FAST_JSON_RESPONSES enabled (and orjson
+installed) list endpoints encode ORM rows straight to bytes with orjson,
+skipping the response_model validation and jsonable_encoder passes; otherwise
+they fall back to FastAPI's usual path.
+"""
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+FAST_JSON = os.getenv("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+if FAST_JSON and orjson is None:
+    print("FAST_JSON_RESPONSES is set but orjson is not installed; using the standard encoder")
+    FAST_JSON = False
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default)
+    return json.dumps(value, default=json_default).encode()
+
+
+def entry_to_dict(entry) -> dict:
+    return {
+        "id": entry.id,
+        "account": entry.account,
+        "type": entry.type,
+        "amount": entry.amount,
+        "description": entry.description,
+        "project_id": entry.project_id,
+        "posted_at": entry.posted_at,
+    }
+
+
+def render_entries(entries, response: Response):
+    """
+    Return a page of entries for a list endpoint. In fast mode the rows are
+    encoded here and the headers already set on `response` are carried over;
+    a Response from pagination (a 304) is passed through untouched.
+    """
+    if not FAST_JSON or isinstance(entries, Response):
+        return entries
+    return Response(
+        content=dumps([entry_to_dict(entry) for entry in entries]),
+        media_type="application/json",
+        headers=dict(response.headers),
+    )
@@ -0,0 +1,92 @@
+"""
+Schema setup run once the database is reachable: create missing tables, then
+bring existing ones up to date. Every step checks the live schema first, so it
+is safe to run on each start.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.types import Float
+
+from ledger_balances import compute_balances
+from ledger_db import Base
+from ledger_models import AccountBalance
+from ledger_money import DECIMAL_PLACES
+
+# Columns that used to be FLOAT and now hold exact NUMERIC(19, 4) amounts
+MONEY_COLUMNS = [
+    ("ledger_entries", "amount"),
+    ("account_balances", "debit_total"),
+    ("account_balances", "credit_total"),
+]
+
+
+def migrate_float_money_columns(conn):
+    """
+    Convert money columns still stored as floating point to NUMERIC(19, 4),
+    rounding existing values to four places. SQLite has no column types to
+    change, so it is left alone.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    inspector = inspect(conn)
+    for table, column in MONEY_COLUMNS:
+        columns = {c["name"]: c for c in inspector.get_columns(table)}
+        if column in columns and isinstance(columns[column]["type"], Float):
+            print(f"Migrating {table}.{column} from floating point to NUMERIC(19, {DECIMAL_PLACES})")
+            conn.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE NUMERIC(19, {DECIMAL_PLACES}) "
+                f"USING round({column}::numeric, {DECIMAL_PLACES})"
+            ))
+            if table == "account_balances":
+                print("Balances were summed as floats; run 'python ledger_balances.py rebuild' to recompute them exactly")
+
+
+def add_posted_at(conn):
+    """
+    Add the posting timestamp to ledger_entries created before it existed. The
+    true posting time of those rows is unknown, so they are stamped with the
+    time of the migration and fall into the first period closed after it.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    columns = {c["name"] for c in inspect(conn).get_columns("ledger_entries")}
+    if "posted_at" not in columns:
+        print("Adding ledger_entries.posted_at")
+        conn.execute(text("ALTER TABLE ledger_entries ADD COLUMN posted_at TIMESTAMPTZ NOT NULL DEFAULT now()"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_ledger_entries_posted_at ON ledger_entries (posted_at)"))
+
+
+def seed_account_balances(conn):
+    """
+    Fill an empty account_balances table from ledger_entries, so a ledger that
+    had entries before balances were maintained (or whose balances table was
+    recreated) serves a correct trial balance from its first request.
+    """
+    def is_empty(table):
+        return conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is None
+
+    if not is_empty("account_balances") or is_empty("ledger_entries"):
+        return
+    if conn.dialect.name == "postgresql":
+        # Another worker may be seeding too: wait for it, then look again
+        conn.execute(text("LOCK TABLE account_balances IN EXCLUSIVE MODE"))
+        if not is_empty("account_balances"):
+            return
+
+    db = Session(bind=conn)
+    try:
+        totals = compute_balances(db)
+    finally:
+        db.close()
+    print(f"Seeding account_balances from ledger_entries ({len(totals)} balance(s))")
+    conn.execute(AccountBalance.__table__.insert(), [
+        {"account": account, "project_id": project_id, "debit_total": debit, "credit_total": credit}
+        for (account, project_id), (debit, credit) in totals.items()
+    ])
+
+
+def prepare_schema(conn):
+    Base.metadata.create_all(conn)
+    migrate_float_money_columns(conn)
+    add_posted_at(conn)
+    seed_account_balances(conn)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, Enum
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text, Enum, func
 from ledger_db import Base
+from ledger_money import Money
 
 class LedgerEntry(Base):
     __tablename__ = "ledger_entries"
@@ -7,6 +8,46 @@ class LedgerEntry(Base):
     id = Column(Integer, primary_key=True, index=True)
     account = Column(String, nullable=False)
     type = Column(Enum("debit", "credit", name="entry_type"), nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)
     description = Column(String, nullable=True)
     project_id = Column(String, nullable=True)
+    # Set by the database clock once the posting holds the posting lock
+    posted_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+class AccountBalance(Base):
+    """Running totals per account and project, kept in step with ledger_entries on every posting."""
+    __tablename__ = "account_balances"
+
+    account = Column(String, primary_key=True)
+    # Entries without a project are stored under "" so the pair can be a primary key
+    project_id = Column(String, primary_key=True, default="")
+    debit_total = Column(Money, nullable=False, default=0)
+    credit_total = Column(Money, nullable=False, default=0)
+
+class LedgerPeriod(Base):
+    """A closed accounting period; balances up to period_end are in balance_snapshots."""
+    __tablename__ = "ledger_periods"
+
+    period_end = Column(DateTime(timezone=True), primary_key=True)
+    closed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class BalanceSnapshot(Base):
+    """Cumulative totals per account and project for everything posted up to period_end."""
+    __tablename__ = "balance_snapshots"
+
+    period_end = Column(DateTime(timezone=True), ForeignKey("ledger_periods.period_end"), primary_key=True)
+    account = Column(String, primary_key=True)
+    project_id = Column(String, primary_key=True, default="")
+    debit_total = Column(Money, nullable=False, default=0)
+    credit_total = Column(Money, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    """Response recorded for a client-supplied idempotency key, replayed on retries."""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    # Fingerprint of the request body, to refuse a key reused for a different posting
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
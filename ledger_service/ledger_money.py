@@ -0,0 +1,30 @@
+"""
+Money helpers. Amounts are stored as NUMERIC(19, 4) and handled as Decimal; any
+totals computed in Python are done on NumPy int64 arrays of minor units (1/10000)
+so they are exact and vectorised instead of per-row float additions.
+"""
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import Numeric
+
+# Four decimal places, matching the NUMERIC(19, 4) columns
+DECIMAL_PLACES = 4
+MINOR_UNITS = 10 ** DECIMAL_PLACES
+
+Money = Numeric(19, DECIMAL_PLACES)
+
+# Largest amount accepted on one ledger line. NUMERIC(19, 4) could hold more, but
+# int64 minor units top out near 9.2e14, so the cap leaves room to sum a batch.
+MAX_AMOUNT = Decimal(10) ** 10
+# Lines of MAX_AMOUNT that can be summed without overflowing int64
+MAX_SUMMED_LINES = int(np.iinfo(np.int64).max // (int(MAX_AMOUNT) * MINOR_UNITS))
+
+
+def to_minor_units(amounts, count: int = -1) -> np.ndarray:
+    """Convert an iterable of Decimal amounts into an int64 array of minor units."""
+    return np.fromiter((int(Decimal(a).scaleb(DECIMAL_PLACES)) for a in amounts), dtype=np.int64, count=count)
+
+
+def from_minor_units(value) -> Decimal:
+    return Decimal(int(value)).scaleb(-DECIMAL_PLACES)
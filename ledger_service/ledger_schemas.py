@@ -1,27 +1,81 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, condecimal
 from typing import List, Literal, Optional
+from datetime import datetime
+
+from ledger_money import MAX_AMOUNT
+
+# Amounts are accepted as exact decimals with at most four places (NUMERIC(19, 4)),
+# below MAX_AMOUNT so batch totals stay exact; responses keep rendering them as
+# JSON numbers for existing clients.
+MoneyAmount = condecimal(max_digits=19, decimal_places=4, gt=-MAX_AMOUNT, lt=MAX_AMOUNT)
 
 class Entry(BaseModel):
     account: str
     type: Literal["debit", "credit"]
-    amount: float
+    amount: MoneyAmount
     description: str
-    project_id: str = None
+    project_id: Optional[str] = None
 
 class JournalEntryRequest(BaseModel):
     entries: List[Entry]
+    # Same key on a retry returns the first result instead of posting again
+    idempotency_key: Optional[str] = None
 
 class JournalEntryResponse(BaseModel):
     status: str
     message: str
 
+class JournalEntryBatchRequest(BaseModel):
+    journal_entries: List[JournalEntryRequest]
+
+class BatchEntryResult(BaseModel):
+    index: int
+    status: Literal["posted", "duplicate", "rejected"]
+    message: str
+
+class JournalEntryBatchResponse(BaseModel):
+    status: str
+    posted: int
+    duplicate: int = 0
+    rejected: int
+    results: List[BatchEntryResult]
+
 class EntryOut(BaseModel):
     id: int
     account: str
     type: Literal["debit", "credit"]
     amount: float
     description: str
-    project_id: str = None
+    project_id: Optional[str] = None
+    posted_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
+
+class TrialBalanceLine(BaseModel):
+    account: str
+    debit: float
+    credit: float
+    balance: float
+
+class TrialBalanceResponse(BaseModel):
+    project_id: Optional[str] = None
+    # Set for point-in-time queries, with the closed period the answer started from
+    as_of: Optional[datetime] = None
+    snapshot_period_end: Optional[datetime] = None
+    lines: List[TrialBalanceLine]
+    total_debit: float
+    total_credit: float
+    balanced: bool
+
+class ChangesResponse(BaseModel):
+    changes: List[EntryOut]
+    next_since: int
+
+class ClosePeriodRequest(BaseModel):
+    period_end: datetime
+
+class ClosePeriodResponse(BaseModel):
+    period_end: datetime
+    previous_period_end: Optional[datetime] = None
+    accounts: int
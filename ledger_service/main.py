@@ -1,14 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends, Header, Query
-from sqlalchemy.orm import Session
-from ledger_models import Base, LedgerEntry
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ledger_models import LedgerEntry, AccountBalance
+from ledger_balances import apply_balance_deltas, as_utc, balances_as_of, close_period, fold_by_account
+from ledger_money import MAX_SUMMED_LINES, from_minor_units, to_minor_units
+from ledger_json import dumps, entry_to_dict, render_entries
+from ledger_migrations import prepare_schema
+from ledger_idempotency import find_keys, record_key, recorded_body, request_fingerprint
 from ledger_schemas import JournalEntryRequest, JournalEntryResponse
-from ledger_db import engine, get_db
-from typing import List, Optional
-from ledger_schemas import EntryOut
+from ledger_schemas import JournalEntryBatchRequest, JournalEntryBatchResponse
+from ledger_db import engine, async_engine, get_db, AsyncSessionLocal, connect_with_backoff, readiness
+from typing import List, Literal, Optional
+from ledger_schemas import EntryOut, TrialBalanceResponse, ChangesResponse
+from ledger_schemas import ClosePeriodRequest, ClosePeriodResponse
 import jwt
-from datetime import datetime
+from datetime import datetime, timezone
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import asyncio
+import hashlib
+import numpy as np
 import os
+import time
 from dotenv import load_dotenv
 import traceback
 
@@ -19,11 +33,55 @@ load_dotenv()
 SERVICE_SECRET = os.getenv("SERVICE_SECRET", "your-service-secret-here")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 
+# Upper bound on the number of ledger lines accepted in one batch request; never
+# more than can be summed in int64 minor units at the maximum amount
+MAX_BATCH_LINES = min(int(os.getenv("LEDGER_MAX_BATCH_LINES", "50000")), MAX_SUMMED_LINES)
+
+# Page sizes for keyset-paginated reads, and rows fetched per round-trip when streaming
+DEFAULT_PAGE_SIZE = int(os.getenv("LEDGER_DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("LEDGER_MAX_PAGE_SIZE", "1000"))
+STREAM_BATCH_SIZE = int(os.getenv("LEDGER_STREAM_BATCH_SIZE", "1000"))
+
+# Change feed: longest long-poll a client may ask for, and how often a waiting
+# request re-checks the table for postings made by other workers
+MAX_CHANGES_WAIT = float(os.getenv("LEDGER_MAX_CHANGES_WAIT", "30"))
+CHANGES_POLL_INTERVAL = float(os.getenv("LEDGER_CHANGES_POLL_INTERVAL", "1"))
+
+# Arbitrary key for the advisory lock that serialises postings on Postgres
+POSTING_LOCK_KEY = 7_340_001
+
 security = HTTPBearer()
 
 app = FastAPI()
 
-Base.metadata.create_all(bind=engine)
+# Background task that waits for the database; kept so shutdown can cancel it
+_startup_tasks = []
+
+@app.on_event("startup")
+async def start_database_connect():
+    _startup_tasks.append(asyncio.create_task(connect_with_backoff(prepare_schema)))
+
+@app.on_event("shutdown")
+async def close_database():
+    for task in _startup_tasks:
+        task.cancel()
+    await async_engine.dispose()
+    engine.dispose()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving, whether or not the database is."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the database has answered and the schema exists, 503 until then."""
+    if not readiness["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "attempts": readiness["attempts"], "error": readiness["last_error"]},
+        )
+    return {"status": "ready", "startup_seconds": readiness["startup_seconds"]}
 
 async def verify_service_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
@@ -39,12 +97,44 @@ async def verify_service_token(credentials: HTTPAuthorizationCredentials = Depen
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
+# Set (and replaced) whenever this worker commits a posting, to wake long-polls early
+_changes_posted = asyncio.Event()
+
+async def begin_posting(db: AsyncSession) -> datetime:
+    """
+    Serialise postings for the rest of the transaction so ledger entry ids become
+    visible in commit order. Without this a reader of the change feed could see
+    id 11 committed before id 10 and skip 10 forever.
+
+    Returns the posting time, read from the database clock after the lock is
+    held, so no entry can be stamped earlier than a period closed before it.
+    """
+    if db.bind.dialect.name == "postgresql":
+        result = await db.execute(
+            text("SELECT pg_advisory_xact_lock(:key), clock_timestamp()"), {"key": POSTING_LOCK_KEY}
+        )
+        return result.one()[1]
+    return datetime.now(timezone.utc)
+
+def notify_changes():
+    global _changes_posted
+    event, _changes_posted = _changes_posted, asyncio.Event()
+    event.set()
+
 @app.post("/api/v1/ledger/journal-entries", response_model=JournalEntryResponse, status_code=201)
 async def create_journal_entry(
     entry: JournalEntryRequest,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
     token_payload: dict = Depends(verify_service_token)
 ):
+    key = idempotency_key or entry.idempotency_key
+    fingerprint = request_fingerprint(entry) if key else None
+    if key:
+        replay = await replay_response(db, key, fingerprint)
+        if replay is not None:
+            return replay
+
     if len(entry.entries) != 2:
         raise HTTPException(status_code=400, detail="Must provide one debit and one credit entry")
 
@@ -60,48 +150,291 @@ async def create_journal_entry(
     db_debit = LedgerEntry(account=debit.account, type="debit", amount=debit.amount, description=debit.description, project_id=getattr(debit, "project_id", None))
     db_credit = LedgerEntry(account=credit.account, type="credit", amount=credit.amount, description=credit.description, project_id=getattr(credit, "project_id", None))
 
+    db_debit.posted_at = db_credit.posted_at = await begin_posting(db)
     db.add_all([db_debit, db_credit])
-    db.commit()
+    await db.run_sync(apply_balance_deltas, [entry_to_dict(db_debit), entry_to_dict(db_credit)])
+    body = {"status": "success", "message": "Journal entry posted"}
+    if key:
+        record_key(db, key, fingerprint, 201, body)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent request with the same key committed first; answer with its result
+        await db.rollback()
+        replay = await replay_response(db, key, fingerprint) if key else None
+        if replay is None:
+            raise
+        return replay
+    notify_changes()
+
+    return body
 
-    return {"status": "success", "message": "Journal entry posted"}
+async def replay_response(db: AsyncSession, key: str, fingerprint: str) -> Optional[JSONResponse]:
+    """The recorded response for an idempotency key, or None if the key is new."""
+    row = (await find_keys(db, [key])).get(key)
+    if row is None:
+        return None
+    if row.request_hash != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency key was already used for a different request")
+    return JSONResponse(status_code=row.status_code, content=recorded_body(row), headers={"Idempotent-Replayed": "true"})
+
+def check_balanced(journal_entries) -> List[Optional[str]]:
+    """
+    For each multi-line journal entry, return why it can't be posted, or None if
+    it balances. Lines from the whole batch are summed together as int64 minor
+    units, so the check is exact and one vectorised pass however large the batch.
+    """
+    line_counts = np.fromiter((len(je.entries) for je in journal_entries), dtype=np.int64, count=len(journal_entries))
+    lines = [line for je in journal_entries for line in je.entries]
+    owner = np.repeat(np.arange(len(journal_entries)), line_counts)
+    is_debit = np.fromiter((line.type == "debit" for line in lines), dtype=bool, count=len(lines))
+    amounts = to_minor_units((line.amount for line in lines), count=len(lines))
+
+    debits = np.zeros(len(journal_entries), dtype=np.int64)
+    credits = np.zeros(len(journal_entries), dtype=np.int64)
+    np.add.at(debits, owner[is_debit], amounts[is_debit])
+    np.add.at(credits, owner[~is_debit], amounts[~is_debit])
+    debit_lines = np.bincount(owner[is_debit], minlength=len(journal_entries))
+    credit_lines = np.bincount(owner[~is_debit], minlength=len(journal_entries))
+
+    errors = []
+    for i in range(len(journal_entries)):
+        if line_counts[i] < 2:
+            errors.append("Journal entry needs at least one debit and one credit line")
+        elif not debit_lines[i] or not credit_lines[i]:
+            errors.append("Both debit and credit required")
+        elif debits[i] != credits[i]:
+            errors.append(
+                f"Debits ({from_minor_units(debits[i])}) and credits ({from_minor_units(credits[i])}) must balance"
+            )
+        else:
+            errors.append(None)
+    return errors
+
+@app.post("/api/v1/ledger/journal-entries/batch", response_model=JournalEntryBatchResponse)
+async def create_journal_entries_batch(
+    batch: JournalEntryBatchRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    token_payload: dict = Depends(verify_service_token)
+):
+    """
+    Post many journal entries, each with any number of lines, in one transaction.
+    Unbalanced entries are rejected individually; every balanced entry is inserted
+    with a single bulk INSERT, so the caller only resends the rejected ones.
+
+    An Idempotency-Key header makes the whole batch replayable. Entries may also
+    carry their own idempotency_key; one already posted is reported as
+    "duplicate" and not posted again, so a retried batch is always safe.
+    """
+    if not batch.journal_entries:
+        raise HTTPException(status_code=400, detail="No journal entries provided")
+    line_count = sum(len(je.entries) for je in batch.journal_entries)
+    if line_count > MAX_BATCH_LINES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {line_count} lines, the limit is {MAX_BATCH_LINES}"
+        )
+
+    batch_fingerprint = request_fingerprint(batch) if idempotency_key else None
+    if idempotency_key:
+        replay = await replay_response(db, idempotency_key, batch_fingerprint)
+        if replay is not None:
+            return replay
+
+    recorded = await find_keys(db, (je.idempotency_key for je in batch.journal_entries))
+    claimed = {}  # key -> fingerprint, for keys posted earlier in this batch
+
+    rows = []
+    results = []
+    new_keys = []
+    errors = check_balanced(batch.journal_entries)
+    for index, journal_entry in enumerate(batch.journal_entries):
+        key = journal_entry.idempotency_key
+        if key:
+            fingerprint = request_fingerprint(journal_entry)
+            previous = recorded[key].request_hash if key in recorded else claimed.get(key)
+            if previous is not None:
+                if previous == fingerprint:
+                    results.append({"index": index, "status": "duplicate", "message": "Already posted with this idempotency key"})
+                else:
+                    results.append({"index": index, "status": "rejected", "message": "Idempotency key was already used for a different journal entry"})
+                continue
+        error = errors[index]
+        if error:
+            results.append({"index": index, "status": "rejected", "message": error})
+            continue
+        rows.extend(
+            {
+                "account": e.account,
+                "type": e.type,
+                "amount": e.amount,
+                "description": e.description,
+                "project_id": e.project_id,
+            }
+            for e in journal_entry.entries
+        )
+        if key:
+            claimed[key] = fingerprint
+            new_keys.append((key, fingerprint))
+        results.append({"index": index, "status": "posted", "message": "Journal entry posted"})
+
+    posted = sum(1 for r in results if r["status"] == "posted")
+    duplicate = sum(1 for r in results if r["status"] == "duplicate")
+    rejected = len(results) - posted - duplicate
+    if not rejected:
+        status = "success"
+    elif posted or duplicate:
+        status = "partial"
+    else:
+        status = "failed"
+    body = {"status": status, "posted": posted, "duplicate": duplicate, "rejected": rejected, "results": results}
+
+    if rows:
+        posted_at = await begin_posting(db)
+        for row in rows:
+            row["posted_at"] = posted_at
+        await db.execute(insert(LedgerEntry.__table__), rows)
+        await db.run_sync(apply_balance_deltas, rows)
+        for key, fingerprint in new_keys:
+            record_key(db, key, fingerprint, 201, {"status": "success", "message": "Journal entry posted"})
+    if idempotency_key:
+        record_key(db, idempotency_key, batch_fingerprint, 200, body)
+    if rows or idempotency_key:
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail="A concurrent request used the same idempotency key; retry to get its result"
+            )
+    if rows:
+        notify_changes()
+
+    return body
+
+def entries_query(project_id: Optional[str] = None, after_id: Optional[int] = None):
+    query = select(LedgerEntry)
+    if project_id:
+        query = query.where(LedgerEntry.project_id == project_id)
+    if after_id is not None:
+        query = query.where(LedgerEntry.id > after_id)
+    return query.order_by(LedgerEntry.id)
+
+def page_etag(ids: List[int], has_next: bool) -> str:
+    """
+    Entries are never changed once posted, so a page is identified by the ids
+    it holds and whether another page follows.
+    """
+    digest = hashlib.sha256(f"{','.join(map(str, ids))}|{has_next}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+async def paginate_entries(
+    db: AsyncSession,
+    project_id: Optional[str],
+    after_id: Optional[int],
+    limit: int,
+    response: Response,
+    if_none_match: Optional[str] = None,
+):
+    """
+    Keyset pagination on LedgerEntry.id. One extra row is fetched to tell whether
+    another page exists; if so its cursor is returned in the X-Next-Cursor header.
+
+    The page's ids are read first to compute its ETag. When it matches
+    If-None-Match a bodiless 304 is returned without loading the entries.
+    """
+    page = entries_query(project_id, after_id).with_only_columns(LedgerEntry.id).limit(limit + 1)
+    ids = (await db.execute(page)).scalars().all()
+    has_next = len(ids) > limit
+    ids = ids[:limit]
+    headers = {"ETag": page_etag(ids, has_next)}
+    if has_next:
+        headers["X-Next-Cursor"] = str(ids[-1])
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    if not ids:
+        return []
+    result = await db.execute(select(LedgerEntry).where(LedgerEntry.id.in_(ids)).order_by(LedgerEntry.id))
+    return result.scalars().all()
+
+def stream_entries(project_id: Optional[str], after_id: Optional[int]) -> StreamingResponse:
+    """
+    Stream entries as NDJSON through a server-side cursor, so memory use stays
+    flat however many rows match. The stream owns its session because it
+    outlives the request's dependencies.
+    """
+    async def generate():
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(entries_query(project_id, after_id))
+            async for partition in result.scalars().partitions(STREAM_BATCH_SIZE):
+                yield b"".join(dumps(entry_to_dict(entry)) + b"\n" for entry in partition)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 @app.get("/api/v1/ledger/journal-entries", response_model=List[EntryOut])
 async def get_journal_entries(
-    db: Session = Depends(get_db),
+    response: Response,
+    after_id: Optional[int] = Query(None, description="Return entries with an id greater than this cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Literal["json", "ndjson"] = Query("json"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
     token_payload: dict = Depends(verify_service_token)
 ):
-    entries = db.query(LedgerEntry).all()
-    return entries
+    if format == "ndjson":
+        return stream_entries(None, after_id)
+    return render_entries(await paginate_entries(db, None, after_id, limit, response, if_none_match), response)
 
 @app.get("/transactions", response_model=List[EntryOut])
 async def get_transactions(
+    response: Response,
     project_id: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    after_id: Optional[int] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Literal["json", "ndjson"] = Query("json"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
     token_payload: dict = Depends(verify_service_token)
 ):
-    query = db.query(LedgerEntry)
-    if project_id:
-        query = query.filter(LedgerEntry.project_id == project_id)
-    return query.all()
+    if format == "ndjson":
+        return stream_entries(project_id, after_id)
+    return render_entries(await paginate_entries(db, project_id, after_id, limit, response, if_none_match), response)
 
 @app.get("/api/v1/ledger/transactions")
 async def get_transactions(
     project_id: str,
-    db: Session = Depends(get_db),
+    response: Response,
+    after_id: Optional[int] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Literal["json", "ndjson"] = Query("json"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
     token_payload: dict = Depends(verify_service_token)
 ):
-    """Get all transactions for a specific project"""
+    """Get transactions for a specific project, one page at a time"""
+    if format == "ndjson":
+        return stream_entries(project_id, after_id)
     try:
-        transactions = db.query(LedgerEntry).filter(
-            LedgerEntry.project_id == project_id
-        ).all()
-        
-        if not transactions:
+        transactions = await paginate_entries(db, project_id, after_id, limit, response, if_none_match)
+
+        if not transactions and after_id is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"No transactions found for project {project_id}"
             )
-        return transactions
+        return render_entries(transactions, response)
     except HTTPException:
         raise
     except Exception as e:
@@ -110,4 +443,100 @@ async def get_transactions(
         raise HTTPException(
             status_code=500,
             detail=f"Error retrieving transactions: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@app.get("/api/v1/ledger/trial-balance", response_model=TrialBalanceResponse)
+async def get_trial_balance(
+    project_id: Optional[str] = Query(None),
+    as_of: Optional[datetime] = Query(None, description="Balances as they stood at this time"),
+    db: AsyncSession = Depends(get_db),
+    token_payload: dict = Depends(verify_service_token)
+):
+    """
+    Trial balance, one row per account. The current one comes from the running
+    account_balances table; with as_of it is the latest closed-period snapshot
+    at or before that time plus the entries posted since.
+    """
+    snapshot_period_end = None
+    if as_of is not None:
+        as_of = as_utc(as_of)
+        snapshot_period_end, totals = await db.run_sync(balances_as_of, as_of)
+        rows = fold_by_account(totals, project_id)
+    else:
+        query = select(
+            AccountBalance.account,
+            func.sum(AccountBalance.debit_total),
+            func.sum(AccountBalance.credit_total),
+        )
+        if project_id is not None:
+            query = query.where(AccountBalance.project_id == project_id)
+        result = await db.execute(query.group_by(AccountBalance.account).order_by(AccountBalance.account))
+        rows = result.all()
+
+    lines = [
+        {"account": account, "debit": debit, "credit": credit, "balance": debit - credit}
+        for account, debit, credit in rows
+    ]
+    total_debit = from_minor_units(to_minor_units((line["debit"] for line in lines), count=len(lines)).sum())
+    total_credit = from_minor_units(to_minor_units((line["credit"] for line in lines), count=len(lines)).sum())
+    return {
+        "project_id": project_id,
+        "as_of": as_of,
+        "snapshot_period_end": snapshot_period_end,
+        "lines": lines,
+        "total_debit": total_debit,
+        "total_credit": total_credit,
+        "balanced": total_debit == total_credit,
+    }
+
+@app.post("/api/v1/ledger/periods/close", response_model=ClosePeriodResponse, status_code=201)
+async def close_ledger_period(
+    request: ClosePeriodRequest,
+    db: AsyncSession = Depends(get_db),
+    token_payload: dict = Depends(verify_service_token)
+):
+    """Close the period ending at period_end by snapshotting every account balance."""
+    period_end = as_utc(request.period_end)
+    # Hold the posting lock so no posting in flight can still be stamped before period_end
+    now = as_utc(await begin_posting(db))
+    if period_end > now:
+        raise HTTPException(status_code=400, detail="Cannot close a period that ends in the future")
+    try:
+        closed = await db.run_sync(close_period, period_end)
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    await db.commit()
+    return closed
+
+@app.get("/api/v1/ledger/changes", response_model=ChangesResponse)
+async def get_changes(
+    since: int = Query(0, ge=0, description="Last sequence number the caller has applied"),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    wait: float = Query(0, ge=0, le=MAX_CHANGES_WAIT, description="Seconds to long-poll when nothing is new"),
+    db: AsyncSession = Depends(get_db),
+    token_payload: dict = Depends(verify_service_token)
+):
+    """
+    Change feed over the ledger. The sequence number is the entry id, which only
+    grows and becomes visible in commit order. Callers apply the returned entries
+    and pass next_since back on the following call.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        posted = _changes_posted
+        result = await db.execute(entries_query(after_id=since).limit(limit))
+        changes = result.scalars().all()
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+        # End the read transaction before waiting: that hands the connection back
+        # to the pool while the poll is idle, and the next query sees new commits
+        await db.rollback()
+        try:
+            await asyncio.wait_for(posted.wait(), timeout=min(remaining, CHANGES_POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+
+    next_since = changes[-1].id if changes else since
+    return {"changes": changes, "next_since": next_since}
@@ -0,0 +1,38 @@
+"""
+Small in-process TTL cache for read-heavy reports. Entries expire after a few
+seconds and the whole cache is cleared on invoice writes, so a worker never
+serves a report older than its own last write. Other workers' writes show up
+once the TTL runs out.
+"""
+import threading
+import time
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            generation = self._generation
+        value = compute()
+        with self._lock:
+            # Skip storing a result computed while a write invalidated the cache
+            if generation == self._generation:
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+                self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
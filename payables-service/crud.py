@@ -0,0 +1,221 @@
+import hashlib
+from datetime import date
+from itertools import islice
+from typing import Optional
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models, schemas, outbox
+
+# Rows validated and checked for duplicates per database round-trip
+IMPORT_CHUNK_SIZE = 1000
+
+
+class ImportTooLarge(Exception):
+    """An import has more rows than the caller allows."""
+
+
+def invoice_values(invoice: schemas.InvoiceCreate, created_by: str) -> dict:
+    """Column values for a new invoice, with the fields the backend fills in."""
+    invoice_data = invoice.dict()
+    invoice_data['status'] = models.InvoiceStatusEnum.pending.value
+    invoice_data['created_by'] = created_by
+
+    # Accept and store expense_account_code and payable_account_code if not present
+    if not invoice_data.get('expense_account_code'):
+        invoice_data['expense_account_code'] = invoice.expense_account
+    if not invoice_data.get('payable_account_code'):
+        invoice_data['payable_account_code'] = invoice.payable_account
+    return invoice_data
+
+
+def vendor_values(invoice: dict) -> dict:
+    return {
+        "vendor_number": invoice["vendor_number"],
+        "name": invoice["vendor_name"],
+        "email": invoice["vendor_email"],
+        "name_key": invoice["vendor_name"].lower(),
+    }
+
+
+def upsert_vendors(db: Session, invoices):
+    """
+    Add the vendors named by these invoices to the vendor table, keeping the
+    existing row when a vendor_number is already known.
+    """
+    vendors = {}
+    for invoice in invoices:
+        vendors.setdefault(invoice["vendor_number"], vendor_values(invoice))
+    if not vendors:
+        return
+    # Sorted so concurrent writers take row locks in the same order
+    rows = [vendors[number] for number in sorted(vendors)]
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = dialect_insert(models.Vendor.__table__).on_conflict_do_nothing(index_elements=["vendor_number"])
+        db.execute(stmt, rows)
+        return
+
+    known = {
+        number for (number,) in db.query(models.Vendor.vendor_number).filter(
+            models.Vendor.vendor_number.in_(list(vendors))
+        )
+    }
+    missing = [row for row in rows if row["vendor_number"] not in known]
+    if missing:
+        db.execute(insert(models.Vendor.__table__), missing)
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_vendors(db: Session, prefix: str, limit: int):
+    """Vendors whose name starts with prefix (case-insensitive), read in index order."""
+    key = prefix.lower()
+    name_key = models.Vendor.name_key
+    query = db.query(models.Vendor).filter(name_key.like(escape_like(key) + "%", escape="\\"))
+    if db.get_bind().dialect.name != "postgresql":
+        # SQLite can't seek an index for LIKE ... ESCAPE; the lower bound gives it a starting point
+        query = query.filter(name_key >= key)
+    return query.order_by(name_key, models.Vendor.vendor_number).limit(limit).all()
+
+
+def invoice_etag(invoice: models.Invoice) -> str:
+    """Strong ETag from the invoice's column values; it changes whenever any of them does."""
+    values = "|".join(str(getattr(invoice, column.name)) for column in models.Invoice.__table__.columns)
+    return f'"{hashlib.sha256(values.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def clean_row(raw) -> dict:
+    """Strip CSV cells and turn empty ones into missing values."""
+    cleaned = {}
+    for key, value in raw.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip() or None
+        cleaned[key.strip()] = value
+    return cleaned
+
+
+def describe_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+    )
+
+
+def import_invoices(db: Session, rows, created_by: str, max_rows: int) -> dict:
+    """
+    Validate and insert invoices from an iterable of dicts (parsed JSON or CSV rows),
+    together with their ledger outbox rows, in one transaction. Each chunk is checked
+    for existing invoice IDs with a single IN query and written with bulk INSERTs;
+    rejected rows are reported by row number and the rest are still imported.
+    """
+    errors = []
+    created = 0
+    seen = set()
+    numbered = enumerate(rows, start=1)
+
+    while True:
+        chunk = list(islice(numbered, IMPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        if chunk[-1][0] > max_rows:
+            raise ImportTooLarge(f"Import is limited to {max_rows} rows")
+
+        valid = []
+        for row_number, raw in chunk:
+            if not isinstance(raw, dict):
+                errors.append({"row": row_number, "invoice_id": None, "error": "Row must be an object"})
+                continue
+            try:
+                invoice = schemas.InvoiceCreate(**clean_row(raw))
+            except ValidationError as e:
+                errors.append({"row": row_number, "invoice_id": raw.get("invoice_id"), "error": describe_validation_error(e)})
+                continue
+            if invoice.amount <= 0:
+                errors.append({"row": row_number, "invoice_id": invoice.invoice_id, "error": "Amount must be greater than 0"})
+                continue
+            if invoice.invoice_id in seen:
+                errors.append({"row": row_number, "invoice_id": invoice.invoice_id, "error": "Duplicate invoice ID in this import"})
+                continue
+            seen.add(invoice.invoice_id)
+            valid.append((row_number, invoice))
+
+        existing = {
+            invoice_id for (invoice_id,) in db.query(models.Invoice.invoice_id).filter(
+                models.Invoice.invoice_id.in_([invoice.invoice_id for _, invoice in valid])
+            )
+        } if valid else set()
+
+        invoice_rows = []
+        outbox_rows = []
+        for row_number, invoice in valid:
+            if invoice.invoice_id in existing:
+                errors.append({"row": row_number, "invoice_id": invoice.invoice_id, "error": "Invoice ID already exists"})
+                continue
+            values = invoice_values(invoice, created_by)
+            invoice_rows.append(values)
+            outbox_rows.append(outbox.outbox_row_for(models.Invoice(**values)))
+
+        if invoice_rows:
+            upsert_vendors(db, invoice_rows)
+            db.execute(insert(models.Invoice.__table__), invoice_rows)
+            db.execute(insert(models.LedgerOutbox.__table__), outbox_rows)
+            created += len(invoice_rows)
+
+    db.commit()
+    # Rows rejected as existing are found after their chunk is validated
+    errors.sort(key=lambda error: error["row"])
+    return {"created": created, "failed": len(errors), "errors": errors}
+
+
+def invoices_query(
+    db: Session,
+    after_id: Optional[str] = None,
+    status: Optional[str] = None,
+    vendor_name: Optional[str] = None,
+    due_from: Optional[date] = None,
+    due_to: Optional[date] = None,
+    project_id: Optional[str] = None,
+    created_by: Optional[str] = None,
+):
+    """
+    Invoices matching the given filters in invoice_id order, starting after the
+    after_id cursor. With no filter, or equality filters only, a (column,
+    invoice_id) index returns rows already in cursor order, so the database seeks
+    to the cursor instead of skipping earlier rows. A due_from/due_to range can
+    narrow the rows via its index but not return them in invoice_id order, so
+    those pages still sort the matching rows and get slower as the range grows.
+    """
+    query = db.query(models.Invoice)
+    if status is not None:
+        query = query.filter(models.Invoice.status == status)
+    if vendor_name is not None:
+        query = query.filter(models.Invoice.vendor_name == vendor_name)
+    if due_from is not None:
+        query = query.filter(models.Invoice.due_date >= due_from)
+    if due_to is not None:
+        query = query.filter(models.Invoice.due_date <= due_to)
+    if project_id is not None:
+        query = query.filter(models.Invoice.project_id == project_id)
+    if created_by is not None:
+        query = query.filter(models.Invoice.created_by == created_by)
+    if after_id is not None:
+        query = query.filter(models.Invoice.invoice_id > after_id)
+    return query.order_by(models.Invoice.invoice_id)
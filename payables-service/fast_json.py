@@ -0,0 +1,59 @@
+"""
+JSON encoding for invoice lists. With FAST_JSON_RESPONSES enabled (and orjson
+installed) list endpoints encode ORM rows straight to bytes with orjson,
+skipping the response_model validation and jsonable_encoder passes; otherwise
+they fall back to FastAPI's usual path.
+"""
+import json
+import os
+from datetime import date
+from decimal import Decimal
+
+from fastapi import Response
+
+import schemas
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+FAST_JSON = os.getenv("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+if FAST_JSON and orjson is None:
+    print("FAST_JSON_RESPONSES is set but orjson is not installed; using the standard encoder")
+    FAST_JSON = False
+
+INVOICE_FIELDS = tuple(schemas.InvoiceResponse.model_fields)
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default)
+    return json.dumps(value, default=json_default).encode()
+
+
+def invoice_to_dict(invoice) -> dict:
+    """The InvoiceResponse fields of a stored invoice, read without validation."""
+    return {field: getattr(invoice, field) for field in INVOICE_FIELDS}
+
+
+def render_invoices(invoices, response: Response):
+    """
+    Return a page of invoices for a list endpoint. In fast mode the rows are
+    encoded here and the headers already set on `response` are carried over.
+    """
+    if not FAST_JSON:
+        return invoices
+    return Response(
+        content=dumps([invoice_to_dict(invoice) for invoice in invoices]),
+        media_type="application/json",
+        headers=dict(response.headers),
+    )
@@ -1,12 +1,18 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from database import engine, SessionLocal
-import models, schemas
+import models, schemas, migrations, outbox, crud, reconciler, reports, fast_json
 from sqlalchemy.exc import IntegrityError
-import requests
 from typing import Union, Optional, List
 import jwt
-from datetime import datetime, timedelta
+from datetime import date, datetime
+import asyncio
+import csv
+import io
+import json
+import tempfile
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 from dotenv import load_dotenv
@@ -18,19 +24,73 @@ load_dotenv()
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
-SERVICE_SECRET = os.getenv("SERVICE_SECRET", "your-service-secret-here")
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth_service:8000")
 
-security = HTTPBearer()
+# Bulk import limits: rows per request, and upload size kept in memory before spooling to disk
+BULK_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", "50000"))
+BULK_SPOOL_MAX_BYTES = int(os.getenv("BULK_IMPORT_SPOOL_MAX_BYTES", str(1024 * 1024)))
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_VENDOR_RESULTS = 50
+MAX_BATCH_GET_IDS = int(os.getenv("MAX_BATCH_GET_IDS", "500"))
 
-# URL of Ledger Service (update as per your actual setup)
-LEDGER_SERVICE_URL = "http://ledger_service:8000/api/v1/ledger/journal-entries"
+security = HTTPBearer()
 
-# Create tables
+# Create tables and bring existing ones up to date
 models.Base.metadata.create_all(bind=engine)
+migrations.upgrade_schema(engine)
 
 app = FastAPI()
 
+# Background outbox dispatcher and reconciler; kept so shutdown can cancel them
+_background_tasks = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    _background_tasks.append(asyncio.create_task(outbox.run_dispatcher()))
+    _background_tasks.append(asyncio.create_task(reconciler.run_reconciler()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Posting lag as of the reconciler's last pass, in Prometheus text format."""
+    stats = reconciler.stats
+    lines = [
+        "# HELP payables_pending_invoices Invoices still in Pending Posting",
+        "# TYPE payables_pending_invoices gauge",
+        f"payables_pending_invoices {stats['pending_invoices']}",
+        "# HELP payables_failed_invoices Invoices the ledger kept rejecting, marked Posting Failed",
+        "# TYPE payables_failed_invoices gauge",
+        f"payables_failed_invoices {stats['failed_invoices']}",
+        "# HELP payables_outbox_rows Journal entries waiting to be posted to the ledger",
+        "# TYPE payables_outbox_rows gauge",
+        f"payables_outbox_rows {stats['outbox_rows']}",
+        "# HELP payables_outbox_failing_rows Waiting journal entries whose last attempt failed",
+        "# TYPE payables_outbox_failing_rows gauge",
+        f"payables_outbox_failing_rows {stats['outbox_failing_rows']}",
+        "# HELP payables_posting_lag_seconds Age of the oldest journal entry waiting to be posted",
+        "# TYPE payables_posting_lag_seconds gauge",
+        f"payables_posting_lag_seconds {stats['oldest_outbox_age_seconds']}",
+        "# HELP payables_reconciler_requeued_total Pending invoices the reconciler queued for posting",
+        "# TYPE payables_reconciler_requeued_total counter",
+        f"payables_reconciler_requeued_total {stats['requeued_total']}",
+        "# HELP payables_reconciler_runs_total Completed reconciler passes",
+        "# TYPE payables_reconciler_runs_total counter",
+        f"payables_reconciler_runs_total {stats['runs']}",
+    ]
+    if stats["last_run_at"] is not None:
+        lines += [
+            "# HELP payables_reconciler_last_run_timestamp_seconds When the last reconciler pass finished",
+            "# TYPE payables_reconciler_last_run_timestamp_seconds gauge",
+            f"payables_reconciler_last_run_timestamp_seconds {stats['last_run_at']}",
+        ]
+    return "\n".join(lines) + "\n"
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -51,17 +111,6 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
-# Service-to-service authentication
-def get_service_token():
-    return jwt.encode(
-        {
-            "service": "payables-service",
-            "exp": datetime.utcnow() + timedelta(minutes=5)
-        },
-        SERVICE_SECRET,
-        algorithm=ALGORITHM
-    )
-
 @app.post(
     "/invoices",
     response_model=Union[schemas.InvoiceResponse, schemas.InvoiceErrorResponse],
@@ -78,88 +127,200 @@ async def create_invoice(
     user_email = token_payload.get("sub")
 
     # Set initial status and inject created_by from token
-    invoice_data = invoice.dict()
-    invoice_data['status'] = "Pending Posting"
-    invoice_data['created_by'] = user_email
+    invoice_data = crud.invoice_values(invoice, user_email)
 
-    # Accept and store expense_account_code and payable_account_code if not present
-    if not invoice_data.get('expense_account_code'):
-        invoice_data['expense_account_code'] = invoice.expense_account
-    if not invoice_data.get('payable_account_code'):
-        invoice_data['payable_account_code'] = invoice.payable_account
-
-    # Save invoice to database
+    # Save the invoice and its journal entry together; the outbox dispatcher
+    # posts the entry to the ledger and marks the invoice "Posted"
     db_invoice = models.Invoice(**invoice_data)
     db.add(db_invoice)
+    db.add(models.LedgerOutbox(**outbox.outbox_row_for(db_invoice)))
+    crud.upsert_vendors(db, [invoice_data])
     try:
         db.commit()
     except IntegrityError:
         db.rollback()
         raise HTTPException(status_code=400, detail="Invoice ID already exists")
     db.refresh(db_invoice)
+    reports.aging_cache.invalidate()
+    outbox.wake()
 
-    # Construct Journal Entry data
-    journal_entry = {
-        "entries": [
-            {
-                "account": invoice.expense_account,
-                "type": "debit",
-                "amount": invoice.amount,
-                "description": f"Invoice {invoice.invoice_id} expense",
-                "project_id": invoice.project_id
-            },
-            {
-                "account": invoice.payable_account,
-                "type": "credit",
-                "amount": invoice.amount,
-                "description": f"Invoice {invoice.invoice_id} payable",
-                "project_id": invoice.project_id
-            }
-        ]
-    }
+    return db_invoice
+
+@app.post("/invoices/bulk", response_model=schemas.BulkImportResponse)
+async def import_invoices(
+    request: Request,
+    db: Session = Depends(get_db),
+    token_payload: dict = Depends(verify_token)
+):
+    """
+    Import many invoices at once. Send a JSON array of invoices, a text/csv body,
+    or a multipart upload with the CSV in a "file" field; CSV headers are the
+    InvoiceCreate field names. Uploads are spooled to disk and parsed row by row.
+    """
+    user_email = token_payload.get("sub")
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or not hasattr(upload, "file"):
+            raise HTTPException(status_code=400, detail="Multipart upload needs a 'file' field")
+        rows = csv.DictReader(io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=""))
+    elif content_type.startswith("text/csv"):
+        spool = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_MAX_BYTES)
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        rows = csv.DictReader(io.TextIOWrapper(spool, encoding="utf-8-sig", newline=""))
+    else:
+        try:
+            rows = await request.json()
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of invoices")
 
     try:
-        headers = {
-            "Authorization": f"Bearer {get_service_token()}"
-        }
-        response = requests.post(LEDGER_SERVICE_URL, json=journal_entry, headers=headers)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        return {
-            "invoice_id": db_invoice.invoice_id,
-            "message": "Invoice created, but failed to post journal entry.",
-            "error": str(e)
-        }
-
-    # Ledger succeeded, update invoice status
-    db_invoice.status = "Posted"
-    db.commit()
-    db.refresh(db_invoice)
+        result = await run_in_threadpool(crud.import_invoices, db, rows, user_email, BULK_MAX_ROWS)
+    except crud.ImportTooLarge as e:
+        db.rollback()
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded")
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Invoices were created concurrently with the same IDs; retry the import")
+    if result["created"]:
+        reports.aging_cache.invalidate()
+        outbox.wake()
+    return result
 
-    return db_invoice
+@app.post("/invoices/batch-get", response_model=schemas.InvoiceBatchGetResponse)
+def batch_get_invoices(
+    request: schemas.InvoiceBatchGetRequest,
+    db: Session = Depends(get_db),
+    token_payload: dict = Depends(verify_token)
+):
+    """
+    Look up many invoices with one IN query. Each invoice gets the same access
+    check as GET /invoices/{invoice_id}; IDs that don't exist or that the caller
+    may not see are listed separately instead of failing the whole request.
+    """
+    invoice_ids = list(dict.fromkeys(request.invoice_ids))
+    if len(invoice_ids) > MAX_BATCH_GET_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_GET_IDS} invoice IDs per request")
+
+    user_role = token_payload.get("role_name", "").lower()
+    user_email = token_payload.get("sub")
+
+    found = {
+        invoice.invoice_id: invoice
+        for invoice in db.query(models.Invoice).filter(models.Invoice.invoice_id.in_(invoice_ids))
+    } if invoice_ids else {}
+
+    invoices, missing, forbidden = [], [], []
+    for invoice_id in invoice_ids:
+        invoice = found.get(invoice_id)
+        if invoice is None:
+            missing.append(invoice_id)
+        elif user_role == "volunteer" and invoice.created_by != user_email:
+            forbidden.append(invoice_id)
+        else:
+            invoices.append(invoice)
+    return {
+        "invoices": invoices,
+        "missing": missing,
+        "forbidden": forbidden,
+        "etags": {invoice.invoice_id: crud.invoice_etag(invoice) for invoice in invoices},
+    }
 
 @app.get("/invoices", response_model=List[schemas.InvoiceResponse])
 async def get_invoices(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    after_id: Optional[str] = Query(None, description="Return invoices with an invoice_id greater than this cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[models.InvoiceStatusEnum] = None,
+    vendor_name: Optional[str] = None,
+    due_from: Optional[date] = None,
+    due_to: Optional[date] = None,
+    project_id: Optional[str] = None,
+    created_by: Optional[str] = None,
+    mine: bool = Query(False, description="Only invoices created by the caller"),
     db: Session = Depends(get_db),
     token_payload: dict = Depends(verify_token)
 ):
+    """
+    List invoices in invoice_id order with keyset pagination: when another page
+    exists its cursor is returned in the X-Next-Cursor header. Admins see every
+    invoice; everyone else sees only the invoices they created.
+    """
+    user_role = token_payload.get("role_name", "").lower()
+    user_email = token_payload.get("sub")
+    if mine or user_role not in ["admin", "superadmin"]:
+        if created_by is not None and created_by != user_email:
+            raise HTTPException(status_code=403, detail="You can only list your own invoices")
+        created_by = user_email
+
+    query = crud.invoices_query(
+        db,
+        after_id=after_id,
+        status=status.value if status else None,
+        vendor_name=vendor_name,
+        due_from=due_from,
+        due_to=due_to,
+        project_id=project_id,
+        created_by=created_by,
+    )
+    # One extra row tells whether there is another page
+    invoices = query.limit(limit + 1).all()
+    if len(invoices) > limit:
+        invoices = invoices[:limit]
+        response.headers["X-Next-Cursor"] = invoices[-1].invoice_id
+    return fast_json.render_invoices(invoices, response)
+
+@app.get("/invoices/aging", response_model=schemas.AgingReportResponse)
+def get_aging_report(
+    as_of: Optional[date] = Query(None, description="Age invoices as of this date (default today)"),
+    group_by: Optional[schemas.AgingGroupBy] = None,
+    vendor_name: Optional[str] = None,
+    project_id: Optional[str] = None,
+    include_paid: bool = False,
+    db: Session = Depends(get_db),
+    token_payload: dict = Depends(verify_token)
+):
+    """
+    Open invoice amounts bucketed by days past due: current, 1-30, 31-60, 61-90
+    and 90+, optionally broken down by vendor or project. Results are cached for
+    AGING_CACHE_TTL seconds and dropped whenever invoices are written.
+    """
     user_role = token_payload.get("role_name", "").lower()
     if user_role not in ["admin", "superadmin"]:
         raise HTTPException(status_code=403, detail="Only admin and superadmin can access this endpoint")
-    try:
-        invoices = db.query(models.Invoice).offset(skip).limit(limit).all()
-        return invoices
-    except Exception as e:
-        import traceback
-        print("Error in /invoices:", e)
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    return reports.cached_aging_report(
+        db,
+        as_of or date.today(),
+        group_by.value if group_by else None,
+        vendor_name,
+        project_id,
+        include_paid,
+    )
+
+@app.get("/vendors", response_model=List[schemas.VendorResponse])
+def search_vendors(
+    prefix: str = Query(..., min_length=1, max_length=100, description="Start of the vendor name, any case"),
+    limit: int = Query(10, ge=1, le=MAX_VENDOR_RESULTS),
+    db: Session = Depends(get_db),
+    token_payload: dict = Depends(verify_token)
+):
+    """Vendor autocomplete: a range scan on the vendor name index, in name order."""
+    return crud.search_vendors(db, prefix, limit)
 
 @app.get("/invoices/{invoice_id}", response_model=schemas.InvoiceResponse)
 async def get_invoice(
     invoice_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     token_payload: dict = Depends(verify_token)
 ):
@@ -173,4 +334,9 @@ async def get_invoice(
     if user_role == "volunteer" and invoice.created_by != user_email:
         raise HTTPException(status_code=403, detail="Access denied to this invoice")
 
+    # Clients polling an unchanged invoice get a bodiless 304
+    etag = crud.invoice_etag(invoice)
+    if crud.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return invoice
@@ -0,0 +1,87 @@
+"""
+In-place upgrades for tables that create_all() won't touch once they exist.
+Each step inspects the live schema first, so running them on every start is safe.
+"""
+from sqlalchemy import func, inspect, insert, select, text
+from sqlalchemy.types import Float
+
+import models
+
+
+def migrate_float_amounts(conn):
+    """Store invoice amounts as exact NUMERIC(19, 4) instead of floating point."""
+    if conn.dialect.name != "postgresql":
+        return
+    columns = {c["name"]: c for c in inspect(conn).get_columns("invoices")}
+    if "amount" in columns and isinstance(columns["amount"]["type"], Float):
+        print("Migrating invoices.amount from floating point to NUMERIC(19, 4)")
+        conn.execute(text(
+            "ALTER TABLE invoices ALTER COLUMN amount TYPE NUMERIC(19, 4) USING round(amount::numeric, 4)"
+        ))
+
+
+def add_invoice_indexes(conn):
+    """Create the listing indexes declared on Invoice on tables made before they existed."""
+    existing = {index["name"] for index in inspect(conn).get_indexes("invoices")}
+    for index in models.Invoice.__table__.indexes:
+        if index.name not in existing:
+            print(f"Creating index {index.name}")
+            index.create(conn)
+
+
+def add_outbox_failure_columns(conn):
+    """Add the rejection count and failure time to ledger_outbox tables made before them."""
+    columns = {c["name"] for c in inspect(conn).get_columns("ledger_outbox")}
+    if "rejections" not in columns:
+        print("Adding ledger_outbox.rejections")
+        conn.execute(text("ALTER TABLE ledger_outbox ADD COLUMN rejections INTEGER NOT NULL DEFAULT 0"))
+    if "failed_at" not in columns:
+        print("Adding ledger_outbox.failed_at")
+        conn.execute(text("ALTER TABLE ledger_outbox ADD COLUMN failed_at TIMESTAMP"))
+
+
+def migrate_vendor_name_key_collation(conn):
+    """Move vendors.name_key to the "C" collation its search index relies on."""
+    if conn.dialect.name != "postgresql":
+        return
+    collation = conn.execute(text(
+        "SELECT collation_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'vendors' AND column_name = 'name_key'"
+    )).scalar()
+    if collation == "C":
+        return
+    print('Migrating vendors.name_key to COLLATE "C" and rebuilding ix_vendors_name_key')
+    conn.execute(text("DROP INDEX IF EXISTS ix_vendors_name_key"))
+    conn.execute(text('ALTER TABLE vendors ALTER COLUMN name_key TYPE VARCHAR COLLATE "C"'))
+    for index in models.Vendor.__table__.indexes:
+        index.create(conn)
+
+
+def backfill_vendors(conn):
+    """Fill an empty vendor table from the vendors named on existing invoices."""
+    if conn.execute(select(models.Vendor.vendor_number).limit(1)).first() is not None:
+        return
+    invoice = models.Invoice.__table__
+    vendors = (
+        select(
+            invoice.c.vendor_number,
+            func.min(invoice.c.vendor_name),
+            func.min(invoice.c.vendor_email),
+            func.lower(func.min(invoice.c.vendor_name)),
+        )
+        .group_by(invoice.c.vendor_number)
+    )
+    result = conn.execute(
+        insert(models.Vendor.__table__).from_select(["vendor_number", "name", "email", "name_key"], vendors)
+    )
+    if result.rowcount:
+        print(f"Backfilled {result.rowcount} vendor(s) from invoices")
+
+
+def upgrade_schema(engine):
+    with engine.begin() as conn:
+        migrate_float_amounts(conn)
+        add_invoice_indexes(conn)
+        add_outbox_failure_columns(conn)
+        migrate_vendor_name_key_collation(conn)
+        backfill_vendors(conn)
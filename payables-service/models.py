@@ -1,12 +1,14 @@
-from sqlalchemy import Column, String, Float, Date
+from sqlalchemy import Column, String, Numeric, Date, DateTime, Integer, Text, ForeignKey, Index
 from database import Base
 from enum import Enum
+from datetime import datetime
 
 from sqlalchemy import Enum as SqlEnum
 
 class InvoiceStatusEnum(str, Enum):
     pending = "Pending Posting"
     posted = "Posted"
+    failed = "Posting Failed"
 
 class Invoice(Base):
     __tablename__ = "invoices"
@@ -17,7 +19,7 @@ class Invoice(Base):
     vendor_number = Column(String, nullable=False)
     invoice_date = Column(Date, nullable=False)
     due_date = Column(Date, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Numeric(19, 4), nullable=False)
     payment_method = Column(String, nullable=False)
     payment_status = Column(String, nullable=False)
     created_by = Column(String, nullable=False)
@@ -28,5 +30,61 @@ class Invoice(Base):
     payable_account_code = Column(String, nullable=True)
     project_id = Column(String, nullable=True)
 
+    # One index per listing filter, each ending in invoice_id so a filtered page
+    # is read in keyset order straight from the index
+    __table_args__ = (
+        Index("ix_invoices_status_invoice_id", "status", "invoice_id"),
+        Index("ix_invoices_vendor_name_invoice_id", "vendor_name", "invoice_id"),
+        Index("ix_invoices_due_date_invoice_id", "due_date", "invoice_id"),
+        Index("ix_invoices_project_id_invoice_id", "project_id", "invoice_id"),
+        Index("ix_invoices_created_by_invoice_id", "created_by", "invoice_id"),
+    )
+
     def __repr__(self):
         return f"<Invoice(id={self.invoice_id}, vendor={self.vendor_name}, amount={self.amount})>"
+
+class Vendor(Base):
+    """
+    One row per vendor_number, filled in from the first invoice that names it.
+    name_key is the lower-cased name, indexed for prefix search.
+    """
+    __tablename__ = "vendors"
+
+    vendor_number = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    email = Column(String, nullable=False)
+    # Byte-order collation on Postgres, so one plain btree index serves both the
+    # LIKE 'prefix%' range and ORDER BY name_key without a sort
+    name_key = Column(String().with_variant(String(collation="C"), "postgresql"), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_vendors_name_key", "name_key", "vendor_number"),
+    )
+
+    def __repr__(self):
+        return f"<Vendor(number={self.vendor_number}, name={self.name})>"
+
+class LedgerOutbox(Base):
+    """
+    Journal entry waiting to be posted to the ledger, written in the same
+    transaction as its invoice and deleted once the ledger has accepted it. A
+    row the ledger keeps rejecting is kept with failed_at set, and no longer
+    retried, so last_error still says why its invoice failed to post.
+    """
+    __tablename__ = "ledger_outbox"
+
+    id = Column(Integer, primary_key=True)
+    invoice_id = Column(String, ForeignKey("invoices.invoice_id"), nullable=False, unique=True)
+    idempotency_key = Column(String, nullable=False, unique=True)
+    payload = Column(Text, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = Column(Text, nullable=True)
+    # Times the ledger refused the entry itself, as opposed to being unreachable
+    rejections = Column(Integer, nullable=False, default=0)
+    failed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<LedgerOutbox(invoice={self.invoice_id}, attempts={self.attempts})>"
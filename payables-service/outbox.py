@@ -0,0 +1,242 @@
+"""
+Transactional outbox for ledger postings.
+
+create_invoice writes the invoice and its journal entry (a LedgerOutbox row) in
+one commit. A background dispatcher drains the outbox in batches to the
+ledger's batch endpoint, retries failures with exponential backoff and marks
+invoices "Posted" once the ledger has accepted their entries. Each entry carries
+an idempotency key, so a retried batch never posts anything twice.
+
+An entry the ledger rejects (rather than failing to answer) is retried
+MAX_REJECTIONS times in case the cause is fixed on the ledger side, then given
+up on: its invoice becomes "Posting Failed" and the outbox row stays, with
+failed_at set, to record the ledger's last answer. To try again, set the
+invoice back to "Pending Posting" and delete the row; the reconciler queues a
+fresh entry for it.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+import jwt
+import requests
+
+import models
+from database import SessionLocal, engine
+
+SERVICE_SECRET = os.getenv("SERVICE_SECRET", "your-service-secret-here")
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+
+LEDGER_BATCH_URL = os.getenv("LEDGER_SERVICE_URL", "http://ledger_service:8000") + "/api/v1/ledger/journal-entries/batch"
+LEDGER_TIMEOUT = float(os.getenv("LEDGER_TIMEOUT", "10"))
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+# How long the dispatcher waits after a wake-up so invoices created together share a batch
+LINGER = float(os.getenv("OUTBOX_LINGER", "0.05"))
+# Idle re-check interval, which also picks up rows written by other workers
+POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", "300"))
+# Batches posted at once while there is a backlog; only Postgres can hand out
+# disjoint batches (SKIP LOCKED), so other databases always use one
+CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+# Ledger answers that would be the same for any subset of a batch, so splitting it doesn't help
+UNSPLITTABLE_STATUSES = {401, 403, 408, 429}
+# Rejections of the same entry before its invoice is marked "Posting Failed"
+MAX_REJECTIONS = int(os.getenv("OUTBOX_MAX_REJECTIONS", "5"))
+# Ledger error text kept in last_error
+MAX_ERROR_LENGTH = 1000
+
+ledger_session = requests.Session()
+
+_wake = None
+_loop = None
+
+
+# Service-to-service authentication
+def get_service_token():
+    return jwt.encode(
+        {
+            "service": "payables-service",
+            "exp": datetime.utcnow() + timedelta(minutes=5)
+        },
+        SERVICE_SECRET,
+        algorithm=ALGORITHM
+    )
+
+
+def journal_entry_for(invoice: models.Invoice) -> dict:
+    return {
+        "entries": [
+            {
+                "account": invoice.expense_account,
+                "type": "debit",
+                "amount": str(invoice.amount),
+                "description": f"Invoice {invoice.invoice_id} expense",
+                "project_id": invoice.project_id
+            },
+            {
+                "account": invoice.payable_account,
+                "type": "credit",
+                "amount": str(invoice.amount),
+                "description": f"Invoice {invoice.invoice_id} payable",
+                "project_id": invoice.project_id
+            }
+        ]
+    }
+
+
+def outbox_row_for(invoice: models.Invoice) -> dict:
+    """Column values for the outbox row of an invoice, to add or bulk insert with it."""
+    return {
+        "invoice_id": invoice.invoice_id,
+        "idempotency_key": f"invoice-{invoice.invoice_id}",
+        "payload": json.dumps(journal_entry_for(invoice)),
+        "attempts": 0,
+        "rejections": 0,
+        "next_attempt_at": datetime.utcnow(),
+        "created_at": datetime.utcnow(),
+    }
+
+
+def retry_later(row: models.LedgerOutbox, error: str):
+    row.attempts += 1
+    row.last_error = error
+    delay = min(RETRY_BASE_DELAY * 2 ** (row.attempts - 1), RETRY_MAX_DELAY)
+    row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+
+def reject(row: models.LedgerOutbox, error: str) -> bool:
+    """Record a rejection; returns True once the row has had MAX_REJECTIONS and is given up on."""
+    row.rejections += 1
+    if row.rejections < MAX_REJECTIONS:
+        retry_later(row, error)
+        return False
+    row.attempts += 1
+    row.last_error = error
+    row.failed_at = datetime.utcnow()
+    return True
+
+
+def post_rows(rows) -> list:
+    """
+    Post outbox rows to the ledger as one batch. Returns (row, error, rejected)
+    triples: error is None once the ledger has accepted the row's entry, and
+    rejected is set when the ledger refused the entry itself, so retrying the
+    same payload is unlikely to help. A 4xx answers the request as a whole, so a
+    batch it rejects is split in half and each half posted separately; that
+    isolates the offending rows and lets the rest go through.
+    """
+    batch = {
+        "journal_entries": [
+            dict(json.loads(row.payload), idempotency_key=row.idempotency_key) for row in rows
+        ]
+    }
+    headers = {"Authorization": f"Bearer {get_service_token()}"}
+    try:
+        response = ledger_session.post(LEDGER_BATCH_URL, json=batch, headers=headers, timeout=LEDGER_TIMEOUT)
+        if 400 <= response.status_code < 500 and response.status_code not in UNSPLITTABLE_STATUSES:
+            if len(rows) > 1:
+                middle = len(rows) // 2
+                return post_rows(rows[:middle]) + post_rows(rows[middle:])
+            error = f"Ledger rejected the entry ({response.status_code}): {response.text[:MAX_ERROR_LENGTH]}"
+            print(f"Outbox row for invoice {rows[0].invoice_id}: {error}")
+            return [(rows[0], error, True)]
+        response.raise_for_status()
+        results = {r["index"]: r for r in response.json()["results"]}
+    except (requests.RequestException, ValueError, KeyError) as e:
+        print(f"Ledger posting failed for {len(rows)} outbox row(s): {e}")
+        return [(row, str(e), False) for row in rows]
+
+    outcome = []
+    for index, row in enumerate(rows):
+        result = results.get(index)
+        if result is None:
+            outcome.append((row, "Missing from ledger response", False))
+        elif result["status"] in ("posted", "duplicate"):
+            outcome.append((row, None, False))
+        else:
+            outcome.append((row, result["message"], result["status"] == "rejected"))
+    return outcome
+
+
+def drain_once() -> int:
+    """
+    Post one batch of due outbox rows to the ledger. Returns how many rows were
+    taken, so the caller knows whether more may be waiting.
+    """
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(models.LedgerOutbox)
+            .filter(
+                models.LedgerOutbox.next_attempt_at <= datetime.utcnow(),
+                models.LedgerOutbox.failed_at.is_(None),
+            )
+            .order_by(models.LedgerOutbox.id)
+            .limit(BATCH_SIZE)
+        )
+        if db.get_bind().dialect.name == "postgresql":
+            # Lets several workers drain concurrently without taking the same rows
+            query = query.with_for_update(skip_locked=True)
+        rows = query.all()
+        if not rows:
+            return 0
+
+        outcomes = {models.InvoiceStatusEnum.posted: [], models.InvoiceStatusEnum.failed: []}
+        for row, error, rejected in post_rows(rows):
+            if error is None:
+                outcomes[models.InvoiceStatusEnum.posted].append(row.invoice_id)
+                db.delete(row)
+            elif rejected and reject(row, error):
+                print(f"Giving up on invoice {row.invoice_id} after {row.rejections} ledger rejection(s): {error}")
+                outcomes[models.InvoiceStatusEnum.failed].append(row.invoice_id)
+            elif not rejected:
+                retry_later(row, error)
+        for status, invoice_ids in outcomes.items():
+            if invoice_ids:
+                db.query(models.Invoice).filter(
+                    models.Invoice.invoice_id.in_(invoice_ids)
+                ).update({models.Invoice.status: status.value}, synchronize_session=False)
+        db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+
+def wake():
+    """Tell the dispatcher there is new work; safe to call from any thread."""
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+async def drain_concurrently(concurrency: int) -> int:
+    """Post up to `concurrency` batches in parallel; returns the smallest batch taken."""
+    results = await asyncio.gather(
+        *(asyncio.to_thread(drain_once) for _ in range(concurrency)), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Outbox dispatcher error: {result}")
+    return min(0 if isinstance(result, Exception) else result for result in results)
+
+
+async def run_dispatcher():
+    global _wake, _loop
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    concurrency = max(1, CONCURRENCY) if engine.dialect.name == "postgresql" else 1
+    backlog = False
+    while True:
+        # A full batch means more rows are probably waiting, so fan out until they are drained
+        taken = await drain_concurrently(concurrency if backlog else 1)
+        backlog = taken >= BATCH_SIZE
+        if backlog:
+            continue
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=POLL_INTERVAL)
+            await asyncio.sleep(LINGER)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
@@ -0,0 +1,117 @@
+"""
+Periodic reconciler for invoices stuck in "Pending Posting".
+
+The outbox retries every entry it holds, but invoices created before the outbox
+existed, or whose outbox row was removed by hand, have nothing left to retry
+them. The reconciler walks pending invoices through the (status, invoice_id)
+index in batches and queues an outbox row for any that lack one; the
+dispatcher then posts them with its usual batching, concurrency limit and
+backoff. Each pass also records how far behind posting is, for /metrics.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+
+import crud, models, outbox
+from database import SessionLocal
+
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "60"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "500"))
+
+# Filled in after each pass and reported by /metrics
+stats = {
+    "runs": 0,
+    "requeued_total": 0,
+    "last_run_at": None,
+    "last_run_seconds": None,
+    "pending_invoices": 0,
+    "failed_invoices": 0,
+    "outbox_rows": 0,
+    "outbox_failing_rows": 0,
+    "oldest_outbox_age_seconds": 0.0,
+}
+
+
+def requeue_batch(db, after_id):
+    """
+    Queue outbox rows for one batch of pending invoices without one. Returns the
+    number queued and the cursor for the next batch (None when done).
+    """
+    invoices = (
+        crud.invoices_query(db, after_id=after_id, status=models.InvoiceStatusEnum.pending.value)
+        .limit(RECONCILE_BATCH_SIZE)
+        .all()
+    )
+    if not invoices:
+        return 0, None
+    queued = {
+        invoice_id for (invoice_id,) in db.query(models.LedgerOutbox.invoice_id).filter(
+            models.LedgerOutbox.invoice_id.in_([invoice.invoice_id for invoice in invoices])
+        )
+    }
+    missing = [outbox.outbox_row_for(invoice) for invoice in invoices if invoice.invoice_id not in queued]
+    if missing:
+        try:
+            db.execute(insert(models.LedgerOutbox.__table__), missing)
+            db.commit()
+        except IntegrityError:
+            # Another worker queued some of them first; the next pass picks up the rest
+            db.rollback()
+            return 0, invoices[-1].invoice_id
+    return len(missing), invoices[-1].invoice_id
+
+
+def count_invoices(db, status: models.InvoiceStatusEnum) -> int:
+    return db.query(func.count(models.Invoice.invoice_id)).filter(models.Invoice.status == status.value).scalar()
+
+
+def measure_lag(db):
+    now = datetime.utcnow()
+    stats["pending_invoices"] = count_invoices(db, models.InvoiceStatusEnum.pending)
+    stats["failed_invoices"] = count_invoices(db, models.InvoiceStatusEnum.failed)
+    # Rows given up on are not waiting any more; they are counted as failed invoices
+    count, failing, oldest = db.query(
+        func.count(models.LedgerOutbox.id),
+        func.count(models.LedgerOutbox.last_error),
+        func.min(models.LedgerOutbox.created_at),
+    ).filter(models.LedgerOutbox.failed_at.is_(None)).one()
+    stats["outbox_rows"] = count
+    stats["outbox_failing_rows"] = failing
+    stats["oldest_outbox_age_seconds"] = (now - oldest).total_seconds() if oldest else 0.0
+
+
+def reconcile_once() -> int:
+    started = time.monotonic()
+    requeued = 0
+    db = SessionLocal()
+    try:
+        after_id = None
+        while True:
+            count, after_id = requeue_batch(db, after_id)
+            requeued += count
+            if after_id is None:
+                break
+        measure_lag(db)
+    finally:
+        db.close()
+    stats["runs"] += 1
+    stats["requeued_total"] += requeued
+    stats["last_run_at"] = time.time()
+    stats["last_run_seconds"] = round(time.monotonic() - started, 3)
+    if requeued:
+        print(f"Reconciler queued {requeued} pending invoice(s) for posting")
+    return requeued
+
+
+async def run_reconciler():
+    while True:
+        try:
+            if await asyncio.to_thread(reconcile_once):
+                outbox.wake()
+        except Exception as e:
+            print(f"Reconciler error: {e}")
+        await asyncio.sleep(RECONCILE_INTERVAL)
@@ -0,0 +1,101 @@
+"""
+Accounts-payable aging. Open invoices are bucketed by days past due_date and
+summed in one GROUP BY, optionally broken down by vendor or project.
+"""
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+import models
+from cache import TTLCache
+
+AGING_CACHE_TTL = float(os.getenv("AGING_CACHE_TTL", "30"))
+
+# Bucket label and the most days past due it covers; the last bucket is open-ended
+AGING_BUCKETS = [("current", 0), ("1-30", 30), ("31-60", 60), ("61-90", 90), ("90+", None)]
+
+GROUP_COLUMNS = {
+    "vendor": models.Invoice.vendor_name,
+    "project": models.Invoice.project_id,
+}
+
+aging_cache = TTLCache(AGING_CACHE_TTL)
+
+
+def bucket_expression(as_of: date):
+    """CASE mapping due_date to a bucket label, with cutoffs computed here so the SQL stays portable."""
+    whens = [
+        (models.Invoice.due_date >= as_of - timedelta(days=max_days), label)
+        for label, max_days in AGING_BUCKETS
+        if max_days is not None
+    ]
+    return case(*whens, else_=AGING_BUCKETS[-1][0])
+
+
+def empty_buckets() -> dict:
+    return {label: {"bucket": label, "count": 0, "total": Decimal(0)} for label, _ in AGING_BUCKETS}
+
+
+def summarize(buckets: dict) -> dict:
+    return {
+        "buckets": list(buckets.values()),
+        "count": sum(b["count"] for b in buckets.values()),
+        "total": sum((b["total"] for b in buckets.values()), Decimal(0)),
+    }
+
+
+def aging_report(
+    db: Session,
+    as_of: date,
+    group_by: Optional[str] = None,
+    vendor_name: Optional[str] = None,
+    project_id: Optional[str] = None,
+    include_paid: bool = False,
+) -> dict:
+    bucket = bucket_expression(as_of).label("bucket")
+    columns = [bucket]
+    group_column = GROUP_COLUMNS.get(group_by)
+    if group_column is not None:
+        columns.append(group_column.label("group_key"))
+    query = db.query(
+        *columns,
+        func.count(models.Invoice.invoice_id).label("count"),
+        func.sum(models.Invoice.amount).label("total"),
+    )
+    if not include_paid:
+        query = query.filter(func.lower(models.Invoice.payment_status) != "paid")
+    if vendor_name is not None:
+        query = query.filter(models.Invoice.vendor_name == vendor_name)
+    if project_id is not None:
+        query = query.filter(models.Invoice.project_id == project_id)
+    rows = query.group_by(*columns).all()
+
+    overall = empty_buckets()
+    groups = {}
+    for row in rows:
+        total = Decimal(row.total or 0)
+        overall[row.bucket]["count"] += row.count
+        overall[row.bucket]["total"] += total
+        if group_column is not None:
+            group = groups.setdefault(row.group_key, empty_buckets())
+            group[row.bucket]["count"] += row.count
+            group[row.bucket]["total"] += total
+
+    report = {"as_of": as_of, "group_by": group_by, **summarize(overall), "groups": None}
+    if group_column is not None:
+        report["groups"] = [
+            {"key": key, **summarize(buckets)}
+            for key, buckets in sorted(groups.items(), key=lambda item: (item[0] is None, item[0] or ""))
+        ]
+    return report
+
+
+def cached_aging_report(db: Session, as_of: date, group_by, vendor_name, project_id, include_paid) -> dict:
+    key = (as_of, group_by, vendor_name, project_id, include_paid)
+    return aging_cache.get_or_compute(
+        key, lambda: aging_report(db, as_of, group_by, vendor_name, project_id, include_paid)
+    )
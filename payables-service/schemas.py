@@ -1,12 +1,21 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, condecimal
 from datetime import date
+from decimal import Decimal
 from enum import Enum
-from typing import Optional
+from typing import Dict, List, Optional
 
 # Enum for invoice status
 class InvoiceStatusEnum(str, Enum):
     pending = "Pending Posting"
     posted = "Posted"
+    failed = "Posting Failed"
+
+# Largest amount the ledger accepts on one line (ledger_money.MAX_AMOUNT); larger
+# invoices would be saved here but rejected by the ledger on every outbox retry
+MAX_AMOUNT = Decimal(10) ** 10
+
+# Exact amount with at most four decimal places, stored as NUMERIC(19, 4)
+MoneyAmount = condecimal(max_digits=19, decimal_places=4, lt=MAX_AMOUNT)
 
 # Input schema for creating an invoice (from user input)
 class InvoiceCreate(BaseModel):
@@ -16,7 +25,7 @@ class InvoiceCreate(BaseModel):
     vendor_number: str
     invoice_date: date
     due_date: date
-    amount: float
+    amount: MoneyAmount
     payment_method: str
     payment_status: str
     expense_account: str
@@ -52,3 +61,58 @@ class InvoiceErrorResponse(BaseModel):
     invoice_id: str
     message: str
     error: str
+
+# Multi-get: invoices found and visible to the caller, plus the IDs that weren't
+class InvoiceBatchGetRequest(BaseModel):
+    invoice_ids: List[str]
+
+class InvoiceBatchGetResponse(BaseModel):
+    invoices: List[InvoiceResponse]
+    missing: List[str]
+    forbidden: List[str]
+    # ETag of each returned invoice, as GET /invoices/{invoice_id} would send it
+    etags: Dict[str, str] = {}
+
+# Bulk import report: one error per rejected row, numbered from 1
+class BulkImportError(BaseModel):
+    row: int
+    invoice_id: Optional[str] = None
+    error: str
+
+class BulkImportResponse(BaseModel):
+    created: int
+    failed: int
+    errors: List[BulkImportError]
+
+# Accounts-payable aging
+class AgingGroupBy(str, Enum):
+    vendor = "vendor"
+    project = "project"
+
+class AgingBucket(BaseModel):
+    bucket: str
+    count: int
+    total: float
+
+class AgingGroup(BaseModel):
+    key: Optional[str] = None
+    buckets: List[AgingBucket]
+    count: int
+    total: float
+
+class AgingReportResponse(BaseModel):
+    as_of: date
+    group_by: Optional[AgingGroupBy] = None
+    buckets: List[AgingBucket]
+    count: int
+    total: float
+    groups: Optional[List[AgingGroup]] = None
+
+# Vendor master record
+class VendorResponse(BaseModel):
+    vendor_number: str
+    name: str
+    email: str
+
+    class Config:
+        from_attributes = True
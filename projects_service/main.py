@@ -1,10 +1,11 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from models import Project, Base
 from schemas import ProjectCreate, ProjectOut
 from database import engine, SessionLocal
 import requests
-from typing import List
+from typing import List, Optional
 import jwt
 from datetime import datetime, timedelta
 import os
@@ -43,21 +44,38 @@ def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
     return db_project
 
 @app.get("/projects/{project_id}/transactions")
-async def get_project_transactions(project_id: str):
-    # Proxy to Ledger Service
+async def get_project_transactions(
+    project_id: str,
+    after_id: Optional[int] = Query(None),
+    limit: Optional[int] = Query(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    # Proxy to Ledger Service, passing the keyset cursor and ETag through in both directions
     LEDGER_SERVICE_URL = "http://ledger_service:8000/api/v1/ledger/transactions"
     headers = {
         "Authorization": f"Bearer {get_service_token()}"
     }
+    if if_none_match:
+        headers["If-None-Match"] = if_none_match
+    params = {"project_id": project_id}
+    if after_id is not None:
+        params["after_id"] = after_id
+    if limit is not None:
+        params["limit"] = limit
     try:
         response = requests.get(
             LEDGER_SERVICE_URL,
-            params={"project_id": project_id},
+            params=params,
             headers=headers,
             timeout=5  # 5 seconds timeout
         )
         response.raise_for_status()  # Raises an HTTPError for bad responses (4xx, 5xx)
-        return response.json()
+        page_headers = {
+            name: response.headers[name] for name in ("ETag", "X-Next-Cursor") if name in response.headers
+        }
+        if response.status_code == 304:
+            return Response(status_code=304, headers=page_headers)
+        return JSONResponse(content=response.json(), headers=page_headers)
     except requests.Timeout:
         raise HTTPException(
             status_code=504,